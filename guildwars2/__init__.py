@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import json
 import logging
@@ -14,7 +15,7 @@ from .daily import DailyMixin
 from .database import DatabaseMixin
 from .emojis import EmojiMixin
 from .events import EventsMixin, EventTimerReminderUnsubscribeView
-from .evtc import EvtcMixin
+from .evtc import MAX_CONCURRENT_FETCHES, MAX_CONCURRENT_UPLOADS, EvtcMixin
 from .exceptions import APIError, APIInactiveError, APIInvalidKey, APIKeyError
 from .guild import GuildMixin
 from .guild.sync import GuildSyncPromptUserConfirmView
@@ -23,7 +24,12 @@ from .key import KeyMixin
 from .misc import MiscMixin
 from .notifiers import NotiifiersMixin
 from .pvp import PvpMixin
+from .rendering import RenderService
 from .skills import SkillsMixin
+from .utils.alerts import PriceAlertIndex
+from .utils.cache import LRUCache, TTLCache
+from .utils.db import WriteBehindBuffer
+from .utils.icons import IconCache
 from .wallet import WalletMixin
 from .worldsync import WorldsyncMixin
 from .wvw import WvwMixin
@@ -48,18 +54,57 @@ class GuildWars2(discord.ext.commands.Cog, AccountMixin, AchievementsMixin,
             self.instabilities = json.load(f)
         self.session = bot.session
         self.boss_schedule = self.generate_schedule()
+        self.boss_to_id = self.generate_boss_to_id()
         self.embed_color = 0xc12d2b
         self.log = logging.getLogger(__name__)
         self.tasks = []
         self.waiting_for = []
         self.emojis = {}
+        self.emoji_table = {}
+        self.emoji_permission_cache = TTLCache(60, maxsize=4096)
         self.chatcode_preview_opted_out_guilds = set()
+        self.feed_validators = {}
+        self.gem_alerts = PriceAlertIndex()
+        self.tp_prices = {}
+        self.evtc_upload_semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+        self.evtc_fetch_semaphore = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+        self.evtc_notification_queue = asyncio.Queue()
+        self.evtc_notifications_queued = set()
+        self.evtc_notification_acks = []
+        self.evtc_notification_workers = []
+        self.evtc_destinations_cache = TTLCache(300)
+        self.encounter_cache = LRUCache(256)
+        self.icon_cache = IconCache(self.session,
+                                    "cogs/guildwars2/cache/icons")
+        self.build_render_cache = LRUCache(128)
+        self.build_cache = LRUCache(256)
+        self.professions_cache = None
+        self.account_links_cache = LRUCache(4096)
+        self.account_links_ready = False
+        self.account_names_cache = TTLCache(60 * 60, maxsize=8192)
+        self.user_docs_cache = TTLCache(30, maxsize=4096)
+        self.user_doc_generations = {}
+        self.user_writes = WriteBehindBuffer(
+            self.bot.database.users, on_flush=self.invalidate_user_docs)
+        self.population_writes = WriteBehindBuffer(
+            self.db.worldpopulation_buckets)
+        self.world_populations = None
+        self.world_population_changes = {}
+        self.population_buckets_ready = False
+        self.population_graph_hq = False
+        self.population_graph_cache = TTLCache(60 * 60, maxsize=128)
+        self.wiki_url_cache = TTLCache(60 * 60 * 24, maxsize=4096)
+        self.chat_link_preview_cache = TTLCache(60 * 60, maxsize=1024)
         try:
             self.font = ImageFont.truetype("GWTwoFont1p1.ttf", size=30)
         except IOError:
             self.font = ImageFont.load_default()
+        self.renderer = RenderService("GWTwoFont1p1.ttf", 30,
+                                      "cogs/guildwars2/cache/icons")
         setup_tasks = [
-            self.prepare_emojis, self.prepare_linkpreview_guild_cache
+            self.prepare_emojis, self.prepare_linkpreview_guild_cache,
+            self.prepare_price_alerts, self.prepare_account_indexes,
+            self.prepare_population_buckets, self.prepare_renderer
         ]
         for task in setup_tasks:
             bot.loop.create_task(task())
@@ -68,10 +113,12 @@ class GuildWars2(discord.ext.commands.Cog, AccountMixin, AchievementsMixin,
             self.world_population_checker, self.guild_synchronizer,
             self.boss_notifier, self.forced_account_names,
             self.event_reminder_task, self.worldsync_task,
-            self.post_evtc_notifications,
+            self.post_evtc_notifications, self.retry_evtc_notifications,
+            self.flush_evtc_notification_acks,
+            self.flush_write_buffers,
             self.daily_mystic_forger_checker_task, self.key_sync_task,
             self.cache_dailies_tomorrow, self.swap_daily_tomorrow_and_today,
-            self.send_daily_notifs
+            self.send_daily_notifs, self.tp_price_poller
         ]
         for task in self.tasks:
             task.start()
@@ -83,6 +130,11 @@ class GuildWars2(discord.ext.commands.Cog, AccountMixin, AchievementsMixin,
     async def cog_unload(self):
         for task in self.tasks:
             task.cancel()
+        for worker in self.evtc_notification_workers:
+            worker.cancel()
+        await self.flush_evtc_notification_acks()
+        await self.flush_write_buffers()
+        self.renderer.shutdown()
 
     async def cog_error_handler(self, interaction, error):
         msg = ""
@@ -105,6 +157,17 @@ class GuildWars2(discord.ext.commands.Cog, AccountMixin, AchievementsMixin,
             return True
         return ctx.channel.permissions_for(ctx.me).embed_links
 
+    async def interaction_check(self, interaction: discord.Interaction):
+        self.begin_user_docs_scope()
+        return True
+
+    async def prepare_renderer(self):
+        # Worker processes need the launcher's entry point to be guarded,
+        # so they're opt in
+        doc = await self.bot.database.get_cog_config(self)
+        if doc and doc.get("render_processes"):
+            self.renderer.set_processes(True)
+
     async def get_embed_color(self, ctx):
         if not hasattr(ctx, "author"):
             return self.embed_color
@@ -485,12 +485,60 @@ class AccountMixin:
                          icon_url=self.bot.user.display_avatar.url)
         await interaction.followup.send(embed=embed)
 
-    async def boss_embed(self, ctx, raids, results, account_name,
-                         last_modified):
+    def generate_boss_to_id(self):
         boss_to_id = defaultdict(list)
         for boss_id, boss in self.gamedata["bosses"].items():
             if "api_name" in boss:
                 boss_to_id[boss["api_name"]].append(int(boss_id))
+        return boss_to_id
+
+    async def get_weekly_dps_reports(self, account_name, start, end):
+        """Latest five reports for every boss id and outcome within the
+        given period, grouped as {(boss_id, success): [report, ...]}"""
+        boss_ids = [_id for ids in self.boss_to_id.values() for _id in ids]
+        cursor = self.db.encounters.aggregate([{
+            "$match": {
+                "players": account_name,
+                "boss_id": {
+                    "$in": boss_ids
+                },
+                "date": {
+                    "$gte": start,
+                    "$lt": end
+                }
+            }
+        }, {
+            "$sort": {
+                "date": pymongo.DESCENDING
+            }
+        }, {
+            "$group": {
+                "_id": {
+                    "boss_id": "$boss_id",
+                    "success": "$success"
+                },
+                "reports": {
+                    "$push": {
+                        "permalink": "$permalink",
+                        "date": "$date"
+                    }
+                }
+            }
+        }, {
+            "$project": {
+                "reports": {
+                    "$slice": ["$reports", 5]
+                }
+            }
+        }])
+        reports = {}
+        async for group in cursor:
+            key = group["_id"]["boss_id"], group["_id"]["success"]
+            reports[key] = group["reports"]
+        return reports
+
+    async def boss_embed(self, ctx, raids, results, account_name,
+                         last_modified):
 
         def is_killed(boss):
             return ":white_check_mark:" if boss["id"] in results else ":x:"
@@ -518,20 +566,16 @@ class AccountMixin:
                                        minute=30)
         next_reset_time = reset_time + datetime.timedelta(weeks=1)
 
-        async def get_dps_reports(boss_id):
-            boss_id = boss_to_id[boss_id]
-            cursor = self.db.encounters.find({
-                "boss_id": {
-                    "$in": boss_id
-                },
-                "players": account_name,
-                "date": {
-                    "$gte": reset_time,
-                    "$lt": next_reset_time
-                },
-                "success": boss["id"] in results
-            }).sort("date", pymongo.DESCENDING).limit(5)
-            return await cursor.to_list(None)
+        weekly_reports = await self.get_weekly_dps_reports(
+            account_name, reset_time, next_reset_time)
+
+        def get_dps_reports(boss):
+            success = boss["id"] in results
+            reports = []
+            for boss_id in self.boss_to_id[boss["id"]]:
+                reports += weekly_reports.get((boss_id, success), [])
+            reports.sort(key=lambda r: r["date"], reverse=True)
+            return reports[:5]
 
         not_completed = []
         embed = discord.Embed(title="Bosses",
@@ -553,7 +597,7 @@ class AccountMixin:
                 if boss["id"] not in results:
                     wing_done = False
                     not_completed.append(boss)
-                reports = await get_dps_reports(boss["id"])
+                reports = get_dps_reports(boss)
                 if reports:
                     boss_name = (f"[{readable_id(boss['id'])}]"
                                  f"({reports[0]['permalink']})")
@@ -25,31 +25,60 @@ class ApiMixin:
             tasks.append(self.call_api(e, key=key, **kwargs))
         return await asyncio.gather(*tasks)
 
+    async def find_key_owner(self, used_key):
+        cursor = self.bot.database.iter(
+            "users", {
+                "$or": [{
+                    "cogs.GuildWars2.key.key": used_key
+                }, {
+                    "cogs.GuildWars2.keys.key": used_key
+                }]
+            })
+        async for doc in cursor:
+            return doc
+        return None
+
     async def cache_result(self, endpoint, result, used_key, user):
-        if endpoint == "account" and user:
-            doc = await self.bot.database.get(user, self)
-            key = doc["key"]
-            keys = doc["keys"]
-            if key["account_name"] != result["name"]:
-                if used_key == key["key"]:
-                    old_name = copy.copy(key["account_name"])
-                    new_name = result["name"]
-                    key["account_name"] = new_name
-                    for alt_key in keys:
-                        if alt_key["account_name"] == old_name:
-                            alt_key["account_name"] = new_name
-                    await self.bot.database.set(user, {
-                        "key": key,
-                        "keys": keys
-                    }, self)
-                    await user.send("Your account name seems to have "
-                                    "changed! I went ahead and updated it, "
-                                    "from `{}` to `{}`.".format(
-                                        old_name, new_name))
-                    await self.bot.database.set(
-                        user, {"name_changes": [old_name, new_name]},
-                        self,
-                        operator="push")
+        if endpoint != "account" or not used_key:
+            return
+        new_name = result["name"]
+        # Only look at the database when the name differs from the last one
+        # seen for this key
+        if self.account_names_cache.get(used_key) == new_name:
+            return
+        if user:
+            doc = await self.get_user_doc(user)
+        else:
+            owner_doc = await self.find_key_owner(used_key)
+            if not owner_doc:
+                return
+            doc = owner_doc.get("cogs", {}).get("GuildWars2", {})
+        key = doc.get("key") or {}
+        keys = doc.get("keys", [])
+        for used in [key] + keys:
+            if used.get("key") == used_key:
+                break
+        else:
+            return
+        if used["account_name"] == new_name:
+            self.account_names_cache.set(used_key, new_name)
+            return
+        if not user:
+            user = self.bot.get_user(owner_doc["_id"])
+            if not user:
+                return
+        old_name = copy.copy(used["account_name"])
+        for alt_key in [key] + keys:
+            if alt_key.get("account_name") == old_name:
+                alt_key["account_name"] = new_name
+        await self.set_user_doc(user, {"key": key, "keys": keys})
+        await self.update_account_links(user, {"key": key, "keys": keys})
+        self.account_names_cache.set(used_key, new_name)
+        await user.send("Your account name seems to have "
+                        "changed! I went ahead and updated it, "
+                        "from `{}` to `{}`.".format(old_name, new_name))
+        await self.set_user_doc(user, {"name_changes": [old_name, new_name]},
+                                operator="push")
 
     @retry(retry=retry_if_exception_type(APIBadRequest),
            reraise=True,
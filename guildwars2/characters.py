@@ -13,6 +13,9 @@ from cogs.guildwars2 import guild
 
 from .exceptions import APIError, APINotFound
 from .skills import Build
+from .utils.attributes import (IGNORED_SLOTS, add_modifier, add_vector,
+                               empty_vector, finalize_attributes, infix_vector,
+                               rename_attributes, rune_vectors, upgrade_vector)
 from .utils.chat import embed_list_lines, zero_width_space
 
 LETTERS = ["🇦", "🇧", "🇨", "🇩", "🇪", "🇫", "🇬", "🇭", "🇮", "🇯"]
@@ -44,14 +47,19 @@ class CharacterGearDropdown(discord.ui.Select):
             self.view.active_equipment = int(self.values[0])
         else:
             self.view.active_build = int(self.values[0])
-        embed = self.view.generate_embed()
-        await interaction.response.edit_message(embed=embed)
+        if self.view.is_loaded():
+            embed = await self.view.generate_embed()
+            return await interaction.response.edit_message(embed=embed)
+        # Rendering the tab might take longer than an interaction allows
+        await interaction.response.defer()
+        embed = await self.view.generate_embed()
+        await interaction.edit_original_response(embed=embed)
 
 
 class CharacterGearView(discord.ui.View):
 
     def __init__(self, equipment_options, build_options, character, emojis,
-                 emoji_cache, user):
+                 emoji_cache, user, equipment_loader, pending_builds=None):
         super().__init__()
         self.value = None
         self.emojis = emojis
@@ -66,6 +74,8 @@ class CharacterGearView(discord.ui.View):
         self.emojis_cache = emoji_cache
         self.user = user
         self.response = None
+        self.equipment_loader = equipment_loader
+        self.pending_builds = pending_builds
 
     async def on_timeout(self) -> None:
         for child in self.children:
@@ -76,7 +86,25 @@ class CharacterGearView(discord.ui.View):
                                 interaction: discord.Interaction) -> bool:
         return interaction.user == self.user
 
-    def generate_embed(self):
+    def is_loaded(self):
+        build = self.builds[self.active_build]
+        equipment = self.equipments[self.active_equipment]
+        return (equipment["fields"] is not None
+                and (build["url"] or not self.pending_builds
+                     or self.pending_builds.done()))
+
+    async def load(self):
+        """Lazily compute the fields of the selected equipment tab, and
+        wait for the build images still being rendered"""
+        equipment = self.equipments[self.active_equipment]
+        if equipment["fields"] is None:
+            equipment["fields"] = await self.equipment_loader(
+                equipment["equipment"])
+        if not self.builds[self.active_build]["url"] and self.pending_builds:
+            await asyncio.shield(self.pending_builds)
+
+    async def generate_embed(self):
+        await self.load()
         build = self.builds[self.active_build]
         equipment = self.equipments[self.active_equipment]
         embed = discord.Embed()
@@ -188,7 +216,7 @@ class CharactersMixin:
 
     async def character_autocomplete(self, interaction: discord.Interaction,
                                      current: str):
-        doc = await self.bot.database.get(interaction.user, self)
+        doc = await self.get_user_doc(interaction.user)
         key = doc.get("key", {})
         if not key:
             return []
@@ -206,9 +234,8 @@ class CharactersMixin:
                 "last_update": datetime.datetime.utcnow(),
                 "characters": character_list
             }
-            await self.bot.database.set(interaction.user,
-                                        {f"character_cache.{account_key}": c},
-                                        self)
+            await self.set_user_doc(interaction.user,
+                                    {f"character_cache.{account_key}": c})
             return c
 
         cache = doc.get("character_cache", {}).get(account_key, {})
@@ -411,7 +438,7 @@ class CharactersMixin:
 
         numbers = []
 
-        async def get_equipment_fields(tab, eq):
+        async def get_equipment_fields(eq):
             fields = []
             runes = collections.defaultdict(int)
             bonuses = collections.defaultdict(int)
@@ -436,43 +463,29 @@ class CharactersMixin:
                 upgrades_to_display = []
                 for item in eq:
                     if item["slot"] == piece:
-                        item_doc = await self.fetch_item(item["id"])
+                        item_doc = items.get(item["id"])
                         line = self.get_emoji(
                             interaction, f"{item_doc['rarity']}_{piece_name}")
                         for upgrade_type in "infusions", "upgrades":
-                            if upgrade_type in item:
-                                for upgrade in item[upgrade_type]:
-                                    upgrade_doc = await self.fetch_item(upgrade
-                                                                        )
-                                    if not upgrade_doc:
-                                        upgrades_to_display.append(
-                                            "Unknown upgrade")
-                                        continue
-                                    details = upgrade_doc["details"]
-                                    if details["type"] == "Rune":
-                                        runes[upgrade_doc["name"]] += 1
-                                    if details["type"] == "Sigil":
-                                        upgrades_to_display.append(
-                                            upgrade_doc["name"])
-                                    if "infix_upgrade" in details:
-                                        if "attributes" in details[
-                                                "infix_upgrade"]:
-                                            for attribute in details[
-                                                    "infix_upgrade"][
-                                                        "attributes"]:
-                                                bonuses[attribute[
-                                                    "attribute"]] += attribute[
-                                                        "modifier"]
-                        if "stats" in item:
-                            stat_name = await self.fetch_statname(
-                                item["stats"]["id"])
-                        else:
-                            try:
-                                stat_id = item_doc["details"]["infix_upgrade"][
-                                    "id"]
-                                stat_name = await self.fetch_statname(stat_id)
-                            except KeyError:
-                                pass
+                            for upgrade in item.get(upgrade_type, []):
+                                upgrade_doc = items.get(upgrade)
+                                if not upgrade_doc:
+                                    upgrades_to_display.append(
+                                        "Unknown upgrade")
+                                    continue
+                                details = upgrade_doc["details"]
+                                if details["type"] == "Rune":
+                                    runes[upgrade_doc["name"]] += 1
+                                if details["type"] == "Sigil":
+                                    upgrades_to_display.append(
+                                        upgrade_doc["name"])
+                                infix = details.get("infix_upgrade", {})
+                                for attribute in infix.get("attributes", []):
+                                    bonuses[attribute[
+                                        "attribute"]] += attribute["modifier"]
+                        stat_id = get_stat_id(item, item_doc)
+                        if stat_id:
+                            stat_name = stats.get(stat_id, {}).get("name", "")
                         line += stat_name
                         if piece.startswith("Weapon"):
                             line += " " + self.readable_attribute(
@@ -512,7 +525,8 @@ class CharactersMixin:
                 upgrade_lines = ["None found"]
             fields.append(("> **BONUSES FROM UPGRADES**",
                            "\n".join(upgrade_lines), False))
-            attributes = await self.calculate_character_attributes(results, eq)
+            attributes = await self.calculate_character_attributes(
+                results, eq, items=items)
             column_1 = []
             column_2 = [zero_width_space,
                         zero_width_space]  # cause power is in a different row
@@ -527,6 +541,38 @@ class CharactersMixin:
             fields.append((zero_width_space, "\n".join(column_2), True))
             return fields
 
+        def get_stat_id(item, item_doc):
+            if "stats" in item:
+                return item["stats"]["id"]
+            try:
+                return item_doc["details"]["infix_upgrade"]["id"]
+            except (KeyError, TypeError):
+                return None
+
+        async def upload_builds(tabs):
+            files = await asyncio.gather(*(
+                tab["build"].render(filename=f"build_{tab['tab']}.png")
+                for tab in tabs))
+            files = [file for file in files if file]
+            if not files:
+                return
+            images_msg = await image_channel.send(files=files)
+            for attachment in images_msg.attachments:
+                file_name = re.search(r"build_\d*\.png",
+                                      attachment.url).group(0)
+                tab_id = int("".join(c for c in file_name if c.isdigit()))
+                for tab in tabs:
+                    if tab["tab"] == tab_id:
+                        tab["url"] = attachment.url
+                        break
+
+        async def upload_remaining_builds(tabs):
+            try:
+                await upload_builds(tabs)
+            except Exception as e:
+                self.log.exception("Exception rendering build templates",
+                                   exc_info=e)
+
         emojis_cache = {
             "build": {
                 "inactive": [],
@@ -565,20 +611,6 @@ class CharactersMixin:
             return await interaction.followup.send("Invalid character name")
         build_tabs = results["build_tabs"]
         equipment_tabs = results["equipment_tabs"]
-        builds = []
-        for tab in build_tabs:
-            build = await Build.from_build_tab(self, tab)
-            file = await build.render(filename=f"build_{tab['tab']}.png")
-            is_active = tab["is_active"]
-            name = tab["build"]["name"]
-            builds.append({
-                "tab": tab["tab"],
-                "file": file,
-                "name": name,
-                "is_active": is_active,
-                "build": build,
-                "url": ""
-            })
         equipments = []
         for tab in equipment_tabs:
             eq = []
@@ -595,24 +627,58 @@ class CharactersMixin:
                         eq.append(item_copy)
                         break
             equipments.append({
-                "fields": await get_equipment_fields(tab, eq),
+                "equipment": eq,
+                "fields": None,
                 "name": tab["name"]
             })
+        # Resolve every item and stat set used in any tab at once, so
+        # that rendering a tab needs no further lookups
+        item_ids = set()
+        for equipment in equipments:
+            for piece in equipment["equipment"]:
+                item_ids.add(piece["id"])
+                item_ids.update(piece.get("infusions", []))
+                item_ids.update(piece.get("upgrades", []))
+        items = (await self.fetch_docs_by_id({"items": item_ids}))["items"]
+        stat_ids = set()
+        for equipment in equipments:
+            for piece in equipment["equipment"]:
+                stat_id = get_stat_id(piece, items.get(piece["id"]))
+                if stat_id:
+                    stat_ids.add(stat_id)
+        stats = (await self.fetch_docs_by_id({"itemstats":
+                                              stat_ids}))["itemstats"]
+
+        built = await asyncio.gather(
+            *(Build.from_build_tab(self, tab) for tab in build_tabs))
+        builds = []
+        for tab, build in zip(build_tabs, built):
+            builds.append({
+                "tab": tab["tab"],
+                "name": tab["build"]["name"],
+                "is_active": tab["is_active"],
+                "build": build,
+                "url": ""
+            })
         numbers = emojis_cache["build"]["active"][:len(builds)]
-        images_msg = await image_channel.send(
-            files=[b["file"] for b in builds if b["file"]])
-        urls = [attachment.url for attachment in images_msg.attachments]
-
-        for url in urls:
-            file_name = re.search(r"build_\d*\.png", url).group(0)
-            tab_id = int("".join(c for c in file_name if c.isdigit()))
-            for tab in builds:
-                if tab["tab"] == tab_id:
-                    tab["url"] = url
-                    break
-        view = CharacterGearView(equipments, builds, results, numbers,
-                                 emojis_cache, interaction.user)
-        embed = view.generate_embed()
+        # Only the active build is needed for the first page, the rest are
+        # rendered in the background
+        active_build = results["active_build_tab"] - 1
+        await upload_builds(builds[active_build:active_build + 1])
+        rest = builds[:active_build] + builds[active_build + 1:]
+        pending_builds = None
+        if rest:
+            pending_builds = asyncio.create_task(
+                upload_remaining_builds(rest))
+        view = CharacterGearView(equipments,
+                                 builds,
+                                 results,
+                                 numbers,
+                                 emojis_cache,
+                                 interaction.user,
+                                 get_equipment_fields,
+                                 pending_builds=pending_builds)
+        embed = await view.generate_embed()
         out = await interaction.followup.send(embed=embed, view=view)
         view.response = out
 
@@ -665,308 +731,60 @@ class CharactersMixin:
         attribute_sub = re.sub('defense', 'Armor', attribute_sub)
         return attribute_sub
 
-    async def calculate_character_attributes(self, character, eq):
-        # TODO remove redundant database calls from eq
-        def search_lvl_to_increase(level: int, lvl_dict):
-            for increase, lvl in lvl_dict.items():
-                if lvl[0] <= level <= lvl[1]:
-                    if level < 11:
-                        return increase
-                    elif level % 2 == 0:
-                        return increase
-                    else:
-                        return 0
-
-        def calc_base_lvl(level: int, acc_baselvl: int, lvl_dict):
-            # Recursive call of search_lvl_to_increase
-            # Calculating the base primary attributes depending on char lvl
-            if level == 1:
-                acc_baselvl += 37
-                return acc_baselvl
-            else:
-                new_acc = acc_baselvl + search_lvl_to_increase(level, lvl_dict)
-                new_lvl = level - 1
-                return calc_base_lvl(new_lvl, new_acc, lvl_dict)
-
-        def search_lvl_to_health(level: int, health_dict):
-            for increase, lvl in health_dict.items():
-                if lvl[0] <= level <= lvl[1]:
-                    return increase
-
-        def calc_base_health(level: int, acc_baselvl: int, health_dict):
-            # Recursive call of search_lvl_to_health
-            # Calculating the base health depending on char lvl
-            if level == 1:
-                acc_baselvl += search_lvl_to_health(level, health_dict)
-                # Parse to int because of possible floats
-                return int(acc_baselvl)
-            else:
-                new_acc = acc_baselvl + search_lvl_to_health(
-                    level, health_dict)
-                new_lvl = level - 1
-                return calc_base_health(new_lvl, new_acc, health_dict)
-
-        attr_list = [
-            'defense', 'Power', 'Vitality', 'Precision', 'Toughness',
-            'Critical Chance', 'Health', 'Concentration', 'Expertise',
-            'BoonDuration', 'ConditionDamage', 'Ferocity', 'CritDamage',
-            'Healing', 'ConditionDuration', 'AgonyResistance'
-        ]
-        percentage_list = [
-            'Critical Chance', 'CritDamage', 'ConditionDuration',
-            'BoonDuration'
-        ]
-        lvl_dict = {
-            7: [2, 10],
-            10: [11, 20],
-            14: [21, 24],
-            15: [25, 26],
-            16: [27, 30],
-            20: [31, 40],
-            24: [41, 44],
-            25: [45, 46],
-            26: [47, 50],
-            30: [51, 60],
-            34: [61, 64],
-            35: [65, 66],
-            36: [67, 70],
-            44: [71, 74],
-            45: [75, 76],
-            46: [77, 80]
-        }
-        health_group1 = {
-            28: [1, 19],
-            70: [20, 39],
-            140: [40, 59],
-            210: [60, 79],
-            280: [80, 80]
-        }
-        health_group2 = {
-            18: [1, 19],
-            45: [20, 39],
-            90: [40, 59],
-            135: [60, 79],
-            180: [80, 80]
-        }
-        health_group3 = {
-            5: [1, 19],
-            12.5: [20, 39],
-            25: [40, 59],
-            37.5: [60, 79],
-            50: [80, 80]
-        }
-
-        profession_group = {
-            "warrior": health_group1,
-            "necromancer": health_group1,
-            "revenant": health_group2,
-            "engineer": health_group2,
-            "ranger": health_group2,
-            "mesmer": health_group2,
-            "guardian": health_group3,
-            "thief": health_group3,
-            "elementalist": health_group3
-        }
-
-        ignore_list = [
-            'HelmAquatic', 'WeaponAquaticA', 'WeaponAquaticB', 'WeaponB1',
-            'WeaponB2', "Sickle", "Axe", "Pick"
-        ]
-        attr_dict = {key: 0 for (key) in attr_list}
-        runes = {}
-        level = character["level"]
+    async def calculate_character_attributes(self, character, eq, items=None):
+        if items is None:
+            ids = set()
+            for piece in eq:
+                ids.add(piece["id"])
+                ids.update(piece.get("upgrades", []))
+                ids.update(piece.get("infusions", []))
+            items = (await self.fetch_docs_by_id({"items": ids}))["items"]
+        vector = empty_vector()
+        runes = collections.Counter()
         for piece in eq:
-            item = await self.fetch_item(piece["id"])
+            if piece["slot"] in IGNORED_SLOTS:
+                continue
+            item = items.get(piece["id"])
             # Gear with selectable values
             if "stats" in piece:
-                if piece["slot"] not in ignore_list:
-                    attributes = piece["stats"]["attributes"]
-                    for attribute in attributes:
-                        attr_dict[attribute] += attributes[attribute]
+                attributes = piece["stats"]["attributes"]
+                for attribute, modifier in attributes.items():
+                    add_modifier(vector, attribute, modifier)
             # Gear with static values, except harvesting tools
             elif "charges" not in piece:
-                if piece["slot"] not in ignore_list:
-                    if "infix_upgrade" in item["details"]:
-                        attributes = item["details"]["infix_upgrade"][
-                            "attributes"]
-                        for attribute in attributes:
-                            attr_dict[attribute["attribute"]] += attribute[
-                                "modifier"]
+                add_vector(vector, infix_vector(item))
             # Get armor rating
             if "defense" in item["details"]:
-                if piece["slot"] not in ignore_list:
-                    attr_dict['defense'] += item["details"]["defense"]
-            # Mapping for old attribute names
-            attr_dict["Concentration"] += attr_dict["BoonDuration"]
-            attr_dict["Ferocity"] += attr_dict["CritDamage"]
-            attr_dict["Expertise"] += attr_dict["ConditionDuration"]
-            # Reset old mapped attributes
-            attr_dict["BoonDuration"] = 0
-            attr_dict["CritDamage"] = 0
-            attr_dict["ConditionDuration"] = 0
-
-        # Have to run again through eq, because attributes
-        # from upgrades are named different
-        # Get stats from item upgrades (runes ...)
+                add_modifier(vector, "defense", item["details"]["defense"])
+        # Mapping for old attribute names. Attributes from upgrades are
+        # named differently, so they're added afterwards
+        rename_attributes(vector)
         for piece in eq:
-            if "upgrades" in piece:
-                if piece["slot"] not in ignore_list:
-                    upgrades = piece["upgrades"]
-                    for upgrade in upgrades:
-                        item_upgrade = await self.fetch_item(upgrade)
-                        # Jewels and stuff
-                        if not item_upgrade:
-                            continue
-                        if "infix_upgrade" in item_upgrade["details"]:
-                            attributes = item_upgrade["details"][
-                                "infix_upgrade"]["attributes"]
-                            for attribute in attributes:
-                                attr_dict[attribute["attribute"]] += attribute[
-                                    "modifier"]
-                        # Runes
-                        if item_upgrade["details"]["type"] == "Rune":
-                            # Rune counter
-                            if upgrade in runes:
-                                runes[upgrade] += 1
-                            else:
-                                runes[upgrade] = 1
-                        elif item_upgrade["details"]["type"] == "Sigil":
-                            pattern_percentage = re.compile("^\+\d{1,}% ")
-                            bonus = item_upgrade["details"]["infix_upgrade"][
-                                "buff"]["description"]
-                            if pattern_percentage.match(bonus):
-                                modifier = re.sub(' .*$', '', bonus)
-                                modifier = re.sub('\+', '', modifier)
-                                modifier = re.sub('%', '', modifier)
-                                attribute_name = bonus.title()
-                                attribute_name = re.sub(
-                                    ' Duration', 'Duration', attribute_name)
-                                attribute_name = re.sub(
-                                    'Duration.*', 'Duration', attribute_name)
-                                attribute_name = re.sub(
-                                    ' Chance', 'Chance', attribute_name)
-                                attribute_name = re.sub(
-                                    'Chance.*', 'Chance', attribute_name)
-                                attribute_name = re.sub(
-                                    '^.* ', '', attribute_name)
-                                attribute_name = re.sub(
-                                    '\.', '', attribute_name)
-                                if attribute_name in attr_dict:
-                                    attr_dict[attribute_name] += int(modifier)
-            # Infusions
-            if "infusions" in piece:
-                if piece["slot"] not in ignore_list:
-                    infusions = piece["infusions"]
-                    for infusion in infusions:
-                        item_infusion = await self.fetch_item(infusion)
-                        if not item_infusion:
-                            continue
-                        if "infix_upgrade" in item_infusion["details"]:
-                            attributes = item_infusion["details"][
-                                "infix_upgrade"]["attributes"]
-                            for attribute in attributes:
-                                if attribute["attribute"] == "BoonDuration":
-                                    attribute["attribute"] = "Concentration"
-                                if attribute[
-                                        "attribute"] == "ConditionDuration":
-                                    attribute["attribute"] = "Expertise"
-                                attr_dict[attribute["attribute"]] += attribute[
-                                    "modifier"]
-
-        for rune, runecount in runes.items():
-            rune_item = await self.fetch_item(rune)
-            if not rune_item:
+            if piece["slot"] in IGNORED_SLOTS:
                 continue
-            bonuses = rune_item["details"]["bonuses"]
-            count = 0
-            for bonus in bonuses:
-                if count < runecount:
-                    pattern_single = re.compile("^\+\d{1,} ")
-                    pattern_all_stats = re.compile(".* [s,S]tats$")
-                    pattern_percentage = re.compile("^\+\d{1,}% ")
-                    # Regex deciding if it's a stat
-                    if pattern_all_stats.match(bonus):
-                        modifier = re.sub(' .*$', '', bonus)
-                        modifier = re.sub('\+', '', modifier)
-                        attr_dict["Power"] += int(modifier)
-                        attr_dict["Vitality"] += int(modifier)
-                        attr_dict["Toughness"] += int(modifier)
-                        attr_dict["Precision"] += int(modifier)
-                        attr_dict["Ferocity"] += int(modifier)
-                        attr_dict["Healing"] += int(modifier)
-                        attr_dict["ConditionDamage"] += int(modifier)
-                    elif pattern_single.match(bonus):
-                        # Regex deciding the attribute name + modifier
-                        modifier = re.sub(' .*$', '', bonus)
-                        modifier = re.sub('\+', '', modifier)
-                        attribute_name = re.sub(' Damage', 'Damage', bonus)
-                        attribute_name = re.sub('Damage.*', 'Damage',
-                                                attribute_name)
-                        attribute_name = re.sub('\+\d{1,} ', '',
-                                                attribute_name)
-                        attribute_name = re.sub(';.*', '', attribute_name)
-                        if attribute_name in attr_dict:
-                            attr_dict[attribute_name] += int(modifier)
-                    elif pattern_percentage.match(bonus):
-                        modifier = re.sub(' .*$', '', bonus)
-                        modifier = re.sub('\+', '', modifier)
-                        modifier = re.sub('%', '', modifier)
-                        attribute_name = re.sub(' Duration', 'Duration', bonus)
-                        attribute_name = re.sub('Duration.*', 'Duration',
-                                                attribute_name)
-                        attribute_name = re.sub('^.* ', '', attribute_name)
-                        if attribute_name in attr_dict:
-                            attr_dict[attribute_name] += int(modifier)
-                    # Amount of runes equipped
-                    count += 1
-
-        # Calculate base value depending on char level
-        basevalue = calc_base_lvl(level, 0, lvl_dict)
-        attr_dict["Power"] += basevalue
-        attr_dict["Vitality"] += basevalue
-        attr_dict["Toughness"] += basevalue
-        attr_dict["Precision"] += basevalue
-        # Calculate derivative attributes
-        # Reset to default after mapped to new attribute name
-        attr_dict["CritDamage"] += round(150 + attr_dict["Ferocity"] / 15, 2)
-        if attr_dict["CritDamage"] == 0:
-            attr_dict["CritDamage"] = int(attr_dict["CritDamage"])
-        attr_dict["BoonDuration"] += round(attr_dict["Concentration"] / 15, 2)
-        if attr_dict["BoonDuration"] == 0:
-            attr_dict["BoonDuration"] = int(attr_dict["BoonDuration"])
-        attr_dict["ConditionDuration"] += round(attr_dict["Expertise"] / 15, 2)
-        if attr_dict["ConditionDuration"] == 0:
-            attr_dict["ConditionDuration"] = int(
-                attr_dict["ConditionDuration"])
-        # Base value of 1000 on lvl 80 doesn't get calculated,
-        # if below lvl 80 dont subtract it
-        if attr_dict["Precision"] < 1000:
-            base_prec = 0
-        else:
-            base_prec = 1000
-        attr_dict["Critical Chance"] = round(
-            4 + ((attr_dict["Precision"] - base_prec) / 21), 2)
-        attr_dict["defense"] += attr_dict["Toughness"]
-
-        # Calculate base health
-        attr_dict["Health"] = calc_base_health(
-            level, 0, profession_group[character["profession"].lower()])
-        attr_dict["Health"] += attr_dict["Vitality"] * 10
-
-        ordered_list = ('Power', 'Toughness', 'Vitality', 'Precision',
-                        'Ferocity', 'ConditionDamage', 'Expertise',
-                        'Concentration', 'AgonyResistance', 'defense',
-                        'Health', 'Critical Chance', 'CritDamage', 'Healing',
-                        'ConditionDuration', 'BoonDuration')
-        # First one is not inline for layout purpose
-        output = {}
-        for attribute in ordered_list:
-            if attribute in percentage_list:
-                attr_dict[attribute] = '{0}%'.format(
-                    round(attr_dict[attribute]), 2)
-            attribute_sub = self.readable_attribute(attribute)
-            output[attribute_sub.title()] = attr_dict[attribute]
-        return output
+            for upgrade in piece.get("upgrades", []):
+                item_upgrade = items.get(upgrade)
+                # Jewels and stuff
+                if not item_upgrade:
+                    continue
+                add_vector(vector, upgrade_vector(item_upgrade))
+                if item_upgrade["details"]["type"] == "Rune":
+                    runes[upgrade] += 1
+            for infusion in piece.get("infusions", []):
+                item_infusion = items.get(infusion)
+                if not item_infusion:
+                    continue
+                add_vector(vector, infix_vector(item_infusion, rename=True))
+        for rune, runecount in runes.items():
+            bonuses = rune_vectors(items[rune])
+            if bonuses:
+                add_vector(vector, bonuses[min(runecount, len(bonuses)) - 1])
+        attributes = finalize_attributes(vector, character["level"],
+                                         character["profession"])
+        return {
+            self.readable_attribute(attribute).title(): value
+            for attribute, value in attributes.items()
+        }
 
     @character_group.command(name="togglepublic")
     async def character_togglepublic(self, interaction: discord.Interaction, *,
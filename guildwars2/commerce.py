@@ -1,8 +1,12 @@
+import datetime
 import operator
 
 import discord
 from discord import app_commands
 from discord.app_commands import Choice
+from discord.ext import tasks
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
 from cogs.guildwars2.utils.db import prepare_search
 
 from .exceptions import APIBadRequest, APIError, APINotFound
@@ -112,18 +116,34 @@ class CommerceMixin:
     async def tp_price(self, interaction: discord.Interaction, item: str):
         """Check price of an item"""
         await interaction.response.defer()
-        try:
-            commerce = 'commerce/prices/'
-            endpoint = commerce + item
-            results = await self.call_api(endpoint)
-        except APINotFound:
-            return await interaction.followup.send("This item isn't on the TP."
-                                                   )
-        except APIError:
-            raise
-        choice = await self.db.items.find_one({"_id": int(item)})
+        item_id = int(item)
+        results = self.tp_prices.get(item_id)
+        now = datetime.datetime.utcnow()
+        if not results or now - results["time"] > datetime.timedelta(
+                minutes=10):
+            try:
+                commerce = 'commerce/prices/'
+                endpoint = commerce + item
+                results = await self.call_api(endpoint)
+            except APINotFound:
+                return await interaction.followup.send(
+                    "This item isn't on the TP.")
+            except APIError:
+                raise
+        await self.db.tp_watchlist.update_one(
+            {"_id": item_id}, {"$set": {
+                "last_requested": now
+            }},
+            upsert=True)
+        choice = await self.db.items.find_one({"_id": item_id})
         buyprice = results["buys"]["unit_price"]
         sellprice = results["sells"]["unit_price"]
+        changes = []
+        for label, delta in ("24h", datetime.timedelta(days=1)), (
+                "7d", datetime.timedelta(days=7)):
+            change = await self.get_tp_price_change(item_id, sellprice, delta)
+            if change is not None:
+                changes.append(f"{label}: {change:+.1f}%")
         itemname = choice["name"]
         level = str(choice["level"])
         rarity = choice["rarity"]
@@ -145,9 +165,94 @@ class CommerceMixin:
             embed.set_thumbnail(url=choice["icon"])
         embed.add_field(name="Buy price", value=buyprice, inline=False)
         embed.add_field(name="Sell price", value=sellprice, inline=False)
+        if changes:
+            embed.add_field(name="Sell price change",
+                            value=" · ".join(changes),
+                            inline=False)
         embed.set_footer(text=choice["chat_link"])
         await interaction.followup.send(embed=embed)
 
+    async def get_tp_price_change(self, item_id, price, delta):
+        """Percent change of the sell price since delta ago, using the
+        stored price history. Returns None if there's no history that far
+        back"""
+        if not price:
+            return None
+        target = datetime.datetime.utcnow() - delta
+        day = datetime.datetime(target.year, target.month, target.day)
+        doc = await self.db.tp_prices.find_one({
+            "item_id": item_id,
+            "day": day
+        })
+        if not doc:
+            return None
+        for sample in doc["samples"]:
+            if sample["t"] >= target:
+                break
+        else:
+            return None
+        if not sample["s"]:
+            return None
+        return (price - sample["s"]) / sample["s"] * 100
+
+    @tasks.loop(minutes=5)
+    async def tp_price_poller(self):
+        now = datetime.datetime.utcnow()
+        try:
+            await self.db.tp_watchlist.delete_many(
+                {"last_requested": {
+                    "$lt": now - datetime.timedelta(days=30)
+                }})
+            item_ids = [
+                doc["_id"]
+                async for doc in self.db.tp_watchlist.find({}, {"_id": 1})
+            ]
+        except PyMongoError as e:
+            self.log.exception("Error reading the TP watchlist", exc_info=e)
+            return
+        day = datetime.datetime(now.year, now.month, now.day)
+        for i in range(0, len(item_ids), 200):
+            chunk = item_ids[i:i + 200]
+            endpoint = "commerce/prices?ids=" + ",".join(map(str, chunk))
+            try:
+                results = await self.call_api(endpoint)
+            except APIError:
+                continue
+            operations = []
+            for result in results:
+                result["time"] = now
+                self.tp_prices[result["id"]] = result
+                sample = {
+                    "t": now,
+                    "b": result["buys"]["unit_price"],
+                    "s": result["sells"]["unit_price"]
+                }
+                bucket = {"item_id": result["id"], "day": day}
+                update = {"$push": {"samples": sample}}
+                operations.append(UpdateOne(bucket, update, upsert=True))
+            if operations:
+                try:
+                    await self.db.tp_prices.bulk_write(operations,
+                                                       ordered=False)
+                except PyMongoError as e:
+                    self.log.exception("Error storing TP price samples",
+                                       exc_info=e)
+
+    @tp_price_poller.error
+    async def tp_price_poller_error(self, error):
+        self.log.exception("Error while polling TP prices", exc_info=error)
+        self.tp_price_poller.restart()
+
+    @tp_price_poller.before_loop
+    async def before_tp_price_poller(self):
+        await self.bot.wait_until_ready()
+        await self.db.tp_prices.create_index([("item_id", 1), ("day", 1)],
+                                             unique=True)
+        await self.db.tp_prices.create_index("day",
+                                             expireAfterSeconds=60 * 60 *
+                                             24 * 90)
+        await self.db.tp_watchlist.create_index("last_requested")
+
     @tp_group.command(name="delivery")
     async def tp_delivery(self, interaction: discord.Interaction):
         """Show your items awaiting in delivery box"""
@@ -260,5 +365,15 @@ class CommerceMixin:
             "You will be notified when price of 400 gems "
             f"drops below {gold} gold",
             ephemeral=True)
-        await self.bot.database.set(interaction.user, {"gemtrack": price},
-                                    self)
+        await self.set_user_doc(interaction.user, {"gemtrack": price})
+        self.gem_alerts.set(interaction.user.id, price)
+
+    async def prepare_price_alerts(self):
+        name = self.__class__.__name__
+        await self.bot.database.users.create_index(f"cogs.{name}.gemtrack",
+                                                   sparse=True)
+        cursor = self.bot.database.iter("users", {"gemtrack": {"$gt": 0}},
+                                        self)
+        async for doc in cursor:
+            self.gem_alerts.set(doc["_id"], doc["gemtrack"])
+        self.gem_alerts.loaded = True
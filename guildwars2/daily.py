@@ -167,6 +167,15 @@ class DailyMixin:
         embed.timestamp = datetime.datetime.utcnow()
         return embed
 
+    def daily_embed_cache_key(self, categories, channel, *, tomorrow=False):
+        # Everything daily_embed varies on for a channel: the categories,
+        # whether emojis can be used there and which day is shown
+        can_use_emojis = True
+        if getattr(channel, "guild", None):
+            can_use_emojis = channel.permissions_for(
+                channel.guild.me).external_emojis
+        return tuple(categories), can_use_emojis, tomorrow
+
     def get_lw_dailies(self, tomorrow=False):
         LWS3_MAPS = [
             "Bloodstone Fen",
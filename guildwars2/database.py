@@ -1,5 +1,7 @@
 import asyncio
 import collections
+import contextvars
+import copy
 import datetime
 import re
 import time
@@ -7,13 +9,16 @@ import time
 import discord
 from discord.app_commands import Choice
 from discord.ext import commands
-from pymongo import ReplaceOne
-from pymongo.errors import BulkWriteError
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 from discord.ext import tasks
 
 from .exceptions import APIError, APIKeyError
 from .utils.db import prepare_search
 
+# User documents already read while handling the current interaction
+user_docs_scope = contextvars.ContextVar("user_docs_scope", default=None)
+
 
 class DatabaseMixin:
 
@@ -112,6 +117,31 @@ class DatabaseMixin:
         await self.get_historical_world_pop_data()
         await ctx.send("Done")
 
+    @database.command(name="migrate_population")
+    async def db_migrate_population(self, ctx):
+        """Move world population history into monthly buckets"""
+        requests = []
+        count = 0
+        cursor = self.db.worldpopulation.find({})
+        async for doc in cursor:
+            requests.append(
+                self.population_bucket_update(doc["world_id"], doc["date"],
+                                              doc["population"]))
+            if len(requests) >= 1000:
+                await self.db.worldpopulation_buckets.bulk_write(
+                    requests, ordered=False)
+                count += len(requests)
+                requests = []
+        if requests:
+            await self.db.worldpopulation_buckets.bulk_write(requests,
+                                                             ordered=False)
+            count += len(requests)
+        await self.bot.database.set_cog_config(
+            self, {"population_buckets_ready": True})
+        self.population_buckets_ready = True
+        await self.load_world_populations()
+        await ctx.send(f"Migrated {count} population samples")
+
     @database.command(name="statistics")
     async def db_stats(self, ctx):
         """Some statistics   """
@@ -121,6 +151,33 @@ class DatabaseMixin:
             }}, self)
         await ctx.send("{} registered users".format(result))
 
+    @database.command(name="backfill_account_links")
+    async def db_backfill_account_links(self, ctx):
+        """Build the account links of all users from their keys"""
+        requests = []
+        count = 0
+        cursor = self.bot.database.iter("users", {"key": {"$ne": None}}, self)
+        async for doc in cursor:
+            accounts = self.get_key_accounts(doc)
+            if not accounts:
+                continue
+            link = {"_id": doc["_id"], "accounts": accounts}
+            requests.append(
+                ReplaceOne({"_id": doc["_id"]}, link, upsert=True))
+            if len(requests) >= 1000:
+                await self.db.account_links.bulk_write(requests,
+                                                       ordered=False)
+                count += len(requests)
+                requests = []
+        if requests:
+            await self.db.account_links.bulk_write(requests, ordered=False)
+            count += len(requests)
+        self.account_links_cache.clear()
+        await self.bot.database.set_cog_config(self,
+                                               {"account_links_ready": True})
+        self.account_links_ready = True
+        await ctx.send(f"Linked accounts of {count} users")
+
     async def get_title(self, title_id):
         try:
             results = await self.db.titles.find_one({"_id": title_id})
@@ -159,8 +216,167 @@ class DatabaseMixin:
     async def fetch_item(self, item):
         return await self.db.items.find_one({"_id": item})
 
+    async def get_professions(self):
+        """Profession documents, indexed by both id and build template code.
+        They're static between game updates, so they're kept in memory"""
+        if not self.professions_cache:
+            by_id = {}
+            by_code = {}
+            async for doc in self.db.professions.find():
+                by_id[doc["_id"]] = doc
+                by_code[doc["code"]] = doc
+            self.professions_cache = {"by_id": by_id, "by_code": by_code}
+        return self.professions_cache
+
+    async def fetch_docs_by_id(self, wanted):
+        """Fetch documents from several collections at once, one query per
+        collection. Takes {collection: ids}, returns {collection: {id: doc}}
+        """
+        docs = collections.defaultdict(dict)
+        for collection, ids in wanted.items():
+            cursor = self.db[collection].find({"_id": {"$in": list(ids)}})
+            async for doc in cursor:
+                docs[collection][doc["_id"]] = doc
+        return docs
+
+    async def prepare_account_indexes(self):
+        name = self.__class__.__name__
+        for field in ("key.account_name", "keys.account_name", "key.key",
+                      "keys.key"):
+            await self.bot.database.users.create_index(
+                f"cogs.{name}.{field}", sparse=True)
+        await self.db.account_links.create_index("accounts")
+        doc = await self.bot.database.get_cog_config(self)
+        if doc:
+            self.account_links_ready = doc.get("account_links_ready", False)
+
+    @staticmethod
+    def get_key_accounts(doc):
+        keys = doc.get("keys", []) + [doc.get("key") or {}]
+        return sorted(
+            {key["account_name"]
+             for key in keys if key.get("account_name")})
+
+    async def update_account_links(self, user, doc):
+        """Mirror the accounts of a user's keys into account_links. Has to be
+        called whenever the keys of a user change"""
+        accounts = self.get_key_accounts(doc)
+        if accounts:
+            await self.db.account_links.replace_one(
+                {"_id": user.id}, {
+                    "_id": user.id,
+                    "accounts": accounts
+                },
+                upsert=True)
+        else:
+            await self.db.account_links.delete_one({"_id": user.id})
+        self.account_links_cache.set(user.id, accounts)
+
+    async def get_linked_accounts(self, user):
+        """Account names of every key the user has added"""
+        if not self.account_links_ready:
+            doc = await self.get_user_doc(user)
+            return self.get_key_accounts(doc)
+        accounts = self.account_links_cache.get(user.id)
+        if accounts is None:
+            doc = await self.db.account_links.find_one({"_id": user.id})
+            accounts = doc["accounts"] if doc else []
+            self.account_links_cache.set(user.id, accounts)
+        return accounts
+
+    async def get_account_owners(self, account_names):
+        """Discord user ids owning a key for any of the given accounts,
+        resolved with a single query. Returns {account_name: [user_id]}"""
+        account_names = list(set(account_names))
+        owners = collections.defaultdict(list)
+        if not account_names:
+            return owners
+        wanted = set(account_names)
+        if self.account_links_ready:
+            cursor = self.db.account_links.find(
+                {"accounts": {
+                    "$in": account_names
+                }})
+            async for doc in cursor:
+                for account_name in wanted.intersection(doc["accounts"]):
+                    owners[account_name].append(doc["_id"])
+            return owners
+        cursor = self.bot.database.iter(
+            "users", {
+                "$or": [{
+                    "cogs.GuildWars2.key.account_name": {
+                        "$in": account_names
+                    }
+                }, {
+                    "cogs.GuildWars2.keys.account_name": {
+                        "$in": account_names
+                    }
+                }]
+            })
+        async for doc in cursor:
+            cog_doc = doc.get("cogs", {}).get("GuildWars2", {})
+            for account_name in wanted.intersection(
+                    self.get_key_accounts(cog_doc)):
+                owners[account_name].append(doc["_id"])
+        return owners
+
+    def begin_user_docs_scope(self):
+        """Start a new scope in the current task, within which every user
+        document is read from the database at most once"""
+        user_docs_scope.set({})
+
+    async def get_user_doc(self, user):
+        scope = user_docs_scope.get()
+        doc = scope.get(user.id) if scope is not None else None
+        if doc is None:
+            doc = self.user_docs_cache.get(user.id)
+            if doc is None:
+                generation = self.user_doc_generations.get(user.id, 0)
+                doc = await self.bot.database.get(user, self)
+                # Don't cache a document that was changed while reading it
+                if generation == self.user_doc_generations.get(user.id, 0):
+                    self.user_docs_cache.set(user.id, doc)
+            if scope is not None:
+                scope[user.id] = doc
+        # Callers are free to modify the returned document
+        return copy.deepcopy(doc)
+
+    async def set_user_doc(self, user, data, **kwargs):
+        result = await self.bot.database.set(user, data, self, **kwargs)
+        self.invalidate_user_doc(user)
+        return result
+
+    def invalidate_user_doc(self, user):
+        self.invalidate_user_docs([user.id])
+        scope = user_docs_scope.get()
+        if scope is not None:
+            scope.pop(user.id, None)
+
+    def invalidate_user_docs(self, user_ids):
+        for user_id in user_ids:
+            self.user_docs_cache.invalidate(user_id)
+            self.user_doc_generations[user_id] = (
+                self.user_doc_generations.get(user_id, 0) + 1)
+
+    async def buffer_user_update(self, user, update, array_filters=None):
+        """Queue an update of the user's document, to be written in bulk
+        along with other background updates. Field names are relative to
+        the cog, like in database.set, array filter identifiers are passed
+        through as they are"""
+        name = self.__class__.__name__
+        update = {
+            operator: {f"cogs.{name}.{k}": v
+                       for k, v in fields.items()}
+            for operator, fields in update.items()
+        }
+        await self.user_writes.add(UpdateOne({"_id": user.id},
+                                             update,
+                                             array_filters=array_filters),
+                                   key=user.id)
+        self.invalidate_user_doc(user)
+
     async def fetch_key(self, user, scopes=None):
-        doc = await self.bot.database.get_user(user, self)
+        doc = await self.get_user_doc(user)
         if not doc or "key" not in doc or not doc["key"]:
             raise APIKeyError(
                 "No API key associated with your account. "
@@ -335,8 +551,16 @@ class DatabaseMixin:
         await self.db.currencies.create_index("name")
         await self.db.skills.create_index("name")
         await self.db.worlds.create_index("name")
+        await self.db.encounters.create_index([("boss_id", 1),
+                                               ("start_date", 1)])
+        await self.db.encounters.create_index([("players", 1),
+                                               ("boss_id", 1), ("date", -1)])
         await self.cache_raids()
         await self.cache_pois()
+        self.build_render_cache.clear()
+        self.build_cache.clear()
+        self.professions_cache = None
+        await self.db.build_renders.drop()
         end = time.time()
         await self.bot.change_presence()
         self.bot.available = True
@@ -391,21 +615,13 @@ class DatabaseMixin:
                             continue
                         date = datetime.datetime.fromtimestamp(
                             entry["time_stamp"] / 1000)
-                        doc = {
-                            "population": pop,
-                            "world_id": world_id,
-                            "date": date
-                        }
-                        await self.db.worldpopulation.replace_one(
-                            {
-                                "world_id": world_id,
-                                "date": date
-                            },
-                            doc,
-                            upsert=True)
+                        await self.population_writes.add(
+                            self.population_bucket_update(
+                                world_id, date, pop))
                         print("added " + world["name"] + ": " + str(pop))
             except Exception as e:
                 print(f"Unable to get data for world: {world['name']}\n{e}")
+        await self.population_writes.flush()
 
     @tasks.loop(
         time=[datetime.time(hour=0, minute=0, tzinfo=datetime.timezone.utc)])
@@ -430,3 +646,12 @@ class DatabaseMixin:
         self.log.exception("Error while caching tomorrow dailies",
                            exc_info=error)
         self.cache_dailies_tomorrow.restart()
+
+    @tasks.loop(seconds=5)
+    async def flush_write_buffers(self):
+        for buffer in self.user_writes, self.population_writes:
+            try:
+                await buffer.flush()
+            except PyMongoError as e:
+                self.log.exception("Error flushing buffered writes",
+                                   exc_info=e)
@@ -1,14 +1,79 @@
+import functools
 import re
 
 import discord
 from discord.ext import commands
 
+ILLEGAL_EMOJI_CHARACTERS = re.compile(r"[.,',:;!?]")
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_emoji_name(name):
+    name = name.lower().replace(" ", "_")
+    # Remove illegal emoji characters
+    return ILLEGAL_EMOJI_CHARACTERS.sub("", name)
+
 
 class EmojiMixin:
 
     async def prepare_emojis(self):
         doc = await self.bot.database.get_cog_config(self)
         self.emojis = doc.get("emojis", {})
+        self.emoji_table = {}
+        for name in self.emojis:
+            self.resolve_emoji(name)
+
+    def resolve_emoji(self, name):
+        """Return the (emoji, string) pair registered under a normalized
+        name. Emojis the bot can't see yet are looked up again later"""
+        resolved = self.emoji_table.get(name)
+        if resolved:
+            return resolved
+        emoji_id = self.emojis.get(name)
+        if not emoji_id:
+            return None
+        emoji_obj = self.bot.get_emoji(emoji_id)
+        if not emoji_obj:
+            return None
+        resolved = self.emoji_table[name] = emoji_obj, str(emoji_obj)
+        return resolved
+
+    def can_use_external_emojis(self, ctx):
+        if isinstance(ctx, discord.Webhook):
+            if not ctx.guild:
+                return True
+            channel = ctx.channel
+            target = ctx.guild.default_role
+        elif isinstance(ctx, discord.Interaction):
+            if ctx.guild is None:
+                return True
+            channel = ctx.channel
+            target = ctx.channel.guild.me
+        else:
+            if isinstance(ctx, (discord.Message, discord.TextChannel)):
+                if ctx.guild:
+                    target = ctx.guild.me
+                else:
+                    target = self.bot.user
+            else:
+                target = None
+            if isinstance(ctx, discord.TextChannel):
+                channel = ctx
+            else:
+                channel = ctx.channel
+            if not channel:
+                return True
+        return self.channel_allows_external_emojis(channel, target)
+
+    def channel_allows_external_emojis(self, channel, target):
+        # Permission checks walk every overwrite of the channel, and these
+        # are checked for every emoji of an embed
+        key = channel.id, getattr(target, "id", None)
+        can_use = self.emoji_permission_cache.get(key)
+        if can_use is None:
+            can_use = channel.permissions_for(target).external_emojis
+            self.emoji_permission_cache.set(key, can_use)
+        return can_use
 
     def get_emoji(self,
                   ctx,
@@ -18,71 +83,15 @@ class EmojiMixin:
                   fallback_fmt="{}",
                   return_obj=False,
                   force_emoji=False):
-        # This monstrosity is due for a rework. But at least it works
-        def get_emoji():
-            search_str = emoji.lower().replace(" ", "_")
-            # Remove illegal emoji characters
-            search_str = re.sub('[\.,\,,\',\:,\;,!\?]', '', search_str)
-            emoji_id = self.emojis.get(search_str)
-            if emoji_id:
-                emoji_obj = self.bot.get_emoji(emoji_id)
-                if emoji_obj:
-                    if return_obj:
-                        return emoji_obj
-                    return str(emoji_obj)
-
-        if force_emoji:
-            em = get_emoji()
-            if em:
-                return em
-            elif fallback:
+        if force_emoji or (ctx and self.can_use_external_emojis(ctx)):
+            resolved = self.resolve_emoji(normalize_emoji_name(emoji))
+            if resolved:
+                return resolved[0] if return_obj else resolved[1]
+            if fallback:
                 return fallback_fmt.format(emoji)
-            return
-        if isinstance(ctx, discord.Webhook):
-            if ctx.guild:
-                can_use = ctx.channel.permissions_for(
-                    ctx.guild.default_role).external_emojis
-            else:
-                can_use = True
-        elif isinstance(ctx, (discord.Message, discord.TextChannel)):
-            if ctx.guild:
-                me = ctx.guild.me
-            else:
-                me = self.bot.user
-        elif isinstance(ctx, discord.Interaction):
-            is_dm = ctx.guild is None
-            if not is_dm:
-                me = ctx.channel.guild.me
-            else:
-                em = get_emoji()
-                if em:
-                    return em
-                elif fallback:
-                    return fallback_fmt.format(emoji)
-                return ""
-        else:
-            me = None
-        if ctx:
-            if isinstance(ctx, discord.Interaction):
-                can_use = ctx.channel.permissions_for(me).external_emojis
-            else:
-                if isinstance(ctx, discord.TextChannel):
-                    channel = ctx
-                elif ctx.channel:
-                    channel = ctx.channel
-                else:
-                    channel = None
-                if channel:
-                    can_use = channel.permissions_for(me).external_emojis
-                else:
-                    can_use = True
-            if can_use:
-                em = get_emoji()
-                if em:
-                    return em
-                elif fallback:
-                    return fallback_fmt.format(emoji)
-                return ""
+            if force_emoji:
+                return
+            return ""
         if fallback:
             return fallback_fmt.format(emoji)
         return ""
@@ -113,5 +122,5 @@ class EmojiMixin:
     def check_emoji_permission(self, interaction: discord.Interaction):
         if not interaction.guild:
             return True
-        return interaction.channel.permissions_for(
-            interaction.guild.default_role).external_emojis
+        return self.channel_allows_external_emojis(
+            interaction.channel, interaction.guild.default_role)
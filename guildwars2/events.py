@@ -5,6 +5,7 @@ import discord
 from discord import app_commands
 from discord.app_commands import Choice
 from discord.ext import tasks
+from pymongo.errors import PyMongoError
 
 UTC_TZ = datetime.timezone.utc
 
@@ -41,12 +42,11 @@ class EventTimerReminderUnsubscribeView(discord.ui.View):
                        custom_id="et:unsubscribe")
     async def unsubscribe(self, interaction: discord.Interaction,
                           button: discord.ui.Button):
-        update_result = await self.cog.bot.database.set(
+        update_result = await self.cog.set_user_doc(
             interaction.user,
             {"event_reminders": {
                 "last_message": interaction.message.id,
             }},
-            self.cog,
             operator="pull",
         )
         if update_result.modified_count:
@@ -96,7 +96,7 @@ class EventsMixin:
                 "This works based off your Discord game status. Make sure to enable it",
             },
         ]
-        doc = await self.bot.database.get(user, self)
+        doc = await self.get_user_doc(user)
         doc = doc.get("et_reminder_settings", {})
         settings = [t["setting"] for t in embed_templates]
         settings = {s: doc.get(s, False) for s in settings}
@@ -149,9 +149,7 @@ class EventsMixin:
                             if t["setting"] == setting)
             embed = setting_embed(template)
             asyncio.create_task(reaction.message.edit(embed=embed))
-            await self.bot.database.set(user,
-                                        {"et_reminder_settings": settings},
-                                        self)
+            await self.set_user_doc(user, {"et_reminder_settings": settings})
         for message in to_cleanup:
             asyncio.create_task(message.delete())
 
@@ -353,7 +351,7 @@ class EventsMixin:
                 return (duration_so_far - position) * 60
 
     # TODO
-    async def process_reminder(self, user, reminder, i):
+    async def process_reminder(self, user, reminder):
         time = self.get_time_until_event(reminder)
 
         if time < reminder["time"] + 30:
@@ -383,14 +381,30 @@ class EventsMixin:
                     embed=embed, view=EventTimerReminderUnsubscribeView(self))
             except discord.HTTPException:
                 return
-            reminder["last_reminded"] = msg.created_at
-            reminder["last_message"] = msg.id
-            await self.bot.database.set(user,
-                                        {f"event_reminders.{i}": reminder},
-                                        self)
+            # The write is delayed, so match the reminder itself rather than
+            # its position, which changes when reminders are removed
+            await self.buffer_user_update(
+                user, {
+                    "$set": {
+                        "event_reminders.$[reminder].last_reminded":
+                        msg.created_at,
+                        "event_reminders.$[reminder].last_message": msg.id
+                    }
+                },
+                array_filters=[{
+                    "reminder.type": reminder.get("type"),
+                    "reminder.name": reminder["name"],
+                    "reminder.time": reminder["time"]
+                }])
 
     @tasks.loop(seconds=10)
     async def event_reminder_task(self):
+        # Reminders sent during the last run must be marked as such first
+        try:
+            await self.user_writes.flush()
+        except PyMongoError as e:
+            self.log.exception("Error flushing reminder updates", exc_info=e)
+            return
         cursor = self.bot.database.iter(
             "users", {"event_reminders": {
                 "$exists": True,
@@ -401,9 +415,8 @@ class EventsMixin:
                 user = doc["_obj"]
                 if not user:
                     continue
-                for i, reminder in enumerate(doc["event_reminders"]):
-                    asyncio.create_task(
-                        self.process_reminder(user, reminder, i))
+                for reminder in doc["event_reminders"]:
+                    asyncio.create_task(self.process_reminder(user, reminder))
             except asyncio.CancelledError:
                 return
             except Exception:
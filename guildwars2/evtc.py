@@ -1,4 +1,5 @@
 import asyncio
+import copy
 import datetime
 import secrets
 from typing import Union
@@ -8,9 +9,12 @@ import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 from discord.app_commands import Choice
+from pymongo.errors import PyMongoError
 from .exceptions import APIError
 from .utils.chat import (embed_list_lines, en_space, magic_space,
                          zero_width_space)
+from .utils.evtc import (SOUGHT_BUFFS, EvtcHeaderParser, EvtcParseError,
+                         summarize_encounter)
 
 UTC_TZ = datetime.timezone.utc
 
@@ -19,6 +23,14 @@ UPLOAD_URL = BASE_URL + "uploadContent"
 JSON_URL = BASE_URL + "getJson"
 TOKEN_URL = BASE_URL + "getUserToken"
 ALLOWED_FORMATS = (".evtc", ".zevtc", ".zip")
+MAX_HEADER_DOWNLOAD = 8 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAX_CONCURRENT_UPLOADS = 4
+MAX_CONCURRENT_FETCHES = 8
+EVTC_NOTIFICATION_WORKERS = 4
+# Failed notifications are retried with a growing delay, then dropped
+EVTC_NOTIFICATION_MAX_ATTEMPTS = 5
+EVTC_NOTIFICATION_RETRY_DELAY = datetime.timedelta(minutes=1)
 
 
 class EvtcGuildSelectionViewSelect(discord.ui.Select):
@@ -95,6 +107,7 @@ class EvtcAutouploadDestinationsSelect(discord.ui.Select):
         for choice in choices:
             await self.cog.db.evtc.destinations.delete_one(
                 {"_id": choice["_id"]})
+        self.cog.evtc_destinations_cache.invalidate(interaction.user.id)
         await interaction.response.edit_message(
             content="Removed selected destinations.", view=None)
         self.view.stop()
@@ -120,36 +133,75 @@ class EvtcMixin:
         parent=evtc_automation_group)
 
     async def get_dpsreport_usertoken(self, user):
-        doc = await self.bot.database.get(user, self)
+        doc = await self.get_user_doc(user)
         token = doc.get("dpsreport_token")
         if not token:
             try:
                 async with self.session.get(TOKEN_URL) as r:
                     data = await r.json()
                     token = data["userToken"]
-                    await self.bot.database.set(user,
-                                                {"dpsreport_token": token},
-                                                self)
+                    await self.set_user_doc(user, {"dpsreport_token": token})
                     return token
             except Exception:
                 return None
 
     async def upload_log(self, file, user, *, anonymous=False):
+        """Stream the attachment to dps.report without buffering it. Unless
+        anonymous, the header is parsed on the way and an encounter that's
+        already been uploaded is reused instead"""
         params = {"json": 1}
         if anonymous:
             params["anonymous"] = "true"
         token = await self.get_dpsreport_usertoken(user)
         if token:
             params["userToken"] = token
-        data = aiohttp.FormData()
-        data.add_field("file", await file.read(), filename=file.filename)
-        async with self.session.post(UPLOAD_URL, data=data,
-                                     params=params) as r:
-            resp = await r.json()
-            error = resp["error"]
-            if error:
-                raise APIError(error)
-            return resp
+        async with self.evtc_upload_semaphore:
+            async with self.session.get(file.url) as download:
+                download.raise_for_status()
+                chunks = download.content.iter_chunked(UPLOAD_CHUNK_SIZE)
+                head = []
+                if not anonymous:
+                    head, header = await self.read_log_header(chunks)
+                    resp = await self.find_uploaded_log(header)
+                    if resp:
+                        return resp
+
+                async def body():
+                    for chunk in head:
+                        yield chunk
+                    head.clear()
+                    async for chunk in chunks:
+                        yield chunk
+
+                data = aiohttp.FormData()
+                data.add_field("file",
+                               body(),
+                               filename=file.filename,
+                               content_type="application/octet-stream")
+                async with self.session.post(UPLOAD_URL,
+                                             data=data,
+                                             params=params) as r:
+                    resp = await r.json()
+                    error = resp["error"]
+                    if error:
+                        raise APIError(error)
+                    return resp
+
+    async def read_log_header(self, chunks):
+        """Read chunks until the log header is parsed. Returns the chunks
+        read so far, so they can still be uploaded, along with the header"""
+        parser = EvtcHeaderParser()
+        head = []
+        read = 0
+        try:
+            async for chunk in chunks:
+                head.append(chunk)
+                read += len(chunk)
+                if parser.feed(chunk) or read > MAX_HEADER_DOWNLOAD:
+                    break
+        except EvtcParseError:
+            pass
+        return head, parser.header
 
     async def find_duplicate_dps_report(self, doc):
         margin_of_error = datetime.timedelta(seconds=10)
@@ -167,14 +219,58 @@ class EvtcMixin:
                 "$lt": doc["start_date"] + margin_of_error
             },
         })
-        return True if doc else False
+        return doc
 
-    async def get_encounter_data(self, encounter_id):
-        async with self.session.get(JSON_URL, params={"id":
-                                                      encounter_id}) as r:
-            return await r.json()
+    async def find_uploaded_log(self, header):
+        """Look up an already recorded encounter matching a parsed header.
+        Encounters recorded without their dps.report id can't be reused"""
+        if not header or not header.start_date or not header.players:
+            return None
+        margin_of_error = datetime.timedelta(seconds=10)
+        doc = await self.db.encounters.find_one({
+            "encounter_id": {
+                "$exists": True
+            },
+            "boss_id": header.boss_id,
+            "players": {
+                "$eq": header.players
+            },
+            "start_date": {
+                "$gte": header.start_date - margin_of_error,
+                "$lt": header.start_date + margin_of_error
+            },
+        })
+        if not doc:
+            return None
+        return {"id": doc["encounter_id"], "permalink": doc["permalink"]}
 
-    async def upload_embed(self, destination, data, permalink):
+    async def get_encounter_data(self, encounter_id):
+        """Return the summarized dps.report JSON of an encounter. The full
+        JSON is only ever downloaded once per encounter"""
+        data = self.encounter_cache.get(encounter_id)
+        if data is None:
+            data = await self.db.encounter_summaries.find_one(
+                {"_id": encounter_id}, {"_id": 0})
+        if data is None:
+            async with self.evtc_fetch_semaphore:
+                async with self.session.get(JSON_URL,
+                                            params={"id": encounter_id}) as r:
+                    data = await r.json()
+            if "players" not in data:
+                return data
+            data = summarize_encounter(data)
+            await self.db.encounter_summaries.replace_one(
+                {"_id": encounter_id}, data, upsert=True)
+            data.pop("_id", None)
+        self.encounter_cache.set(encounter_id, data)
+        # upload_embed annotates the players, don't let it touch the cache
+        return copy.deepcopy(data)
+
+    async def upload_embed(self,
+                           destination,
+                           data,
+                           permalink,
+                           encounter_id=None):
         force_emoji = True if not destination else False
         lines = []
         targets = data["phases"][0]["targets"]
@@ -260,9 +356,8 @@ class EvtcMixin:
         if not wvw:
             embed.add_field(name="> **BOSS**", value="\n".join(boss_lines))
         buff_lines = []
-        sought_buffs = ["Might", "Fury", "Quickness", "Alacrity", "Protection"]
         buffs = []
-        for buff in sought_buffs:
+        for buff in SOUGHT_BUFFS:
             for key, value in data["buffMap"].items():
                 if value["name"] == buff:
                     buffs.append({
@@ -276,7 +371,7 @@ class EvtcMixin:
         icon_line = line
         blank = self.get_emoji(destination, "blank", force_emoji=True)
         first = True
-        for buff in sought_buffs:
+        for buff in SOUGHT_BUFFS:
             if first and not blank:
                 icon_line = icon_line[:-2]
             if not first:
@@ -356,9 +451,17 @@ class EvtcMixin:
             "success": data["success"],
             "duration": duration_time
         }
+        if encounter_id:
+            doc["encounter_id"] = encounter_id
         duplicate = await self.find_duplicate_dps_report(doc)
         if not duplicate:
             await self.db.encounters.insert_one(doc)
+        elif encounter_id and "encounter_id" not in duplicate:
+            await self.db.encounters.update_one(
+                {"_id": duplicate["_id"]},
+                {"$set": {
+                    "encounter_id": encounter_id
+                }})
         embed.timestamp = date
         embed.set_footer(text="Recorded at",
                          icon_url=self.bot.user.display_avatar.url)
@@ -537,6 +640,7 @@ class EvtcMixin:
                 if guild["id"] in view.selected_guilds
             ]
         })
+        self.evtc_destinations_cache.invalidate(interaction.user.id)
 
     @autopost_group.command(name="remove_destinations")
     async def evtc_autoupload_remove(self, interaction: discord.Interaction):
@@ -562,109 +666,246 @@ class EvtcMixin:
                            user,
                            destination,
                            anonymous=False):
-        embeds = []
-        for attachment in files:
-            if attachment.filename.endswith(ALLOWED_FORMATS):
+
+        async def process(attachment):
+            resp = await self.upload_log(attachment,
+                                         user,
+                                         anonymous=anonymous)
+            data = await self.get_encounter_data(resp["id"])
+            return await self.upload_embed(destination, data,
+                                           resp["permalink"], resp["id"])
+
+        # Logs are processed concurrently, but posted in the original order
+        # as soon as each one and all the ones before it are done
+        pending = [(attachment, asyncio.create_task(process(attachment)))
+                   for attachment in files
+                   if attachment.filename.endswith(ALLOWED_FORMATS)]
+        try:
+            for attachment, task in pending:
                 try:
-                    resp = await self.upload_log(attachment,
-                                                 user,
-                                                 anonymous=anonymous)
-                    data = await self.get_encounter_data(resp["id"])
-                    embeds.append(await
-                                  self.upload_embed(destination, data,
-                                                    resp["permalink"]))
+                    embed = await task
                 except Exception as e:
                     self.log.exception("Exception processing EVTC log ",
                                        exc_info=e)
-                    return await destination.send(
-                        content="Error processing your log! :x:")
-        for embed in embeds:
-            await destination.send(embed=embed)
+                    await destination.send(
+                        content="Error processing your log "
+                        f"`{attachment.filename}`! :x:")
+                    continue
+                await destination.send(embed=embed)
+        finally:
+            for _, task in pending:
+                task.cancel()
 
     @tasks.loop(seconds=5)
     async def post_evtc_notifications(self):
-        cursor = self.db.evtc.notifications.find({"posted": False})
+        # Listen for new notifications on a change stream. If the deployment
+        # doesn't support them, this returns after queueing the backlog and
+        # the loop falls back to polling every few seconds
+        try:
+            async with self.db.evtc.notifications.watch(
+                [{"$match": {"operationType": "insert"}}]) as stream:
+                await self.queue_pending_evtc_notifications()
+                async for change in stream:
+                    doc = change["fullDocument"]
+                    if not doc.get("posted"):
+                        self.queue_evtc_notification(doc)
+        except PyMongoError:
+            await self.queue_pending_evtc_notifications()
+
+    @post_evtc_notifications.before_loop
+    async def before_post_evtc_notifications(self):
+        await self.bot.wait_until_ready()
+        for _ in range(EVTC_NOTIFICATION_WORKERS):
+            self.evtc_notification_workers.append(
+                asyncio.create_task(self.evtc_notification_worker()))
+
+    @tasks.loop(minutes=1)
+    async def retry_evtc_notifications(self):
+        # The change stream only sees new notifications, failed ones are
+        # picked up here once their retry delay has passed
+        try:
+            await self.queue_pending_evtc_notifications()
+        except PyMongoError as e:
+            self.log.exception("Failed to queue pending evtc notifications",
+                               exc_info=e)
+
+    @retry_evtc_notifications.before_loop
+    async def before_retry_evtc_notifications(self):
+        await self.bot.wait_until_ready()
+
+    async def queue_pending_evtc_notifications(self):
+        cursor = self.db.evtc.notifications.find({
+            "posted": False,
+            "$or": [{
+                "retry_at": {
+                    "$exists": False
+                }
+            }, {
+                "retry_at": {
+                    "$lte": datetime.datetime.utcnow()
+                }
+            }]
+        })
         async for doc in cursor:
+            self.queue_evtc_notification(doc)
+
+    def queue_evtc_notification(self, doc):
+        if doc["_id"] in self.evtc_notifications_queued:
+            return
+        self.evtc_notifications_queued.add(doc["_id"])
+        self.evtc_notification_queue.put_nowait(doc)
+
+    async def evtc_notification_worker(self):
+        while True:
+            doc = await self.evtc_notification_queue.get()
             try:
-                user = self.bot.get_user(doc["user_id"])
-                destinations = await self.db.evtc.destinations.find({
-                    "user_id":
-                    user.id
-                }).to_list(None)
-                for destination in destinations:
-                    destination["channel"] = self.bot.get_channel(
-                        destination["channel_id"])
-                data = await self.get_encounter_data(doc["encounter_id"])
-                recorded_by = data.get("recordedBy", None)
-                recorded_player_guild = None
-                for player in data["players"]:
-                    if player["name"] == recorded_by:
-                        recorded_player_guild = player.get("guildID")
-                        break
-                embed = await self.upload_embed(None, data, doc["permalink"])
-                embed.set_footer(
-                    text="Autoposted by "
-                    f"{user.name}#{user.discriminator}({user.id})."
-                    " The bot respects the user's permissions; remove their "
-                    "permission to send messages or embed "
-                    "links to stop these messsages.")
-                for destination in destinations:
-                    try:
-                        channel = destination["channel"]
-                        if destination[
-                                "guild_ids"] and recorded_by and recorded_player_guild:
-                            if destination["guild_ids"]:
-                                if recorded_player_guild not in destination[
-                                        "guild_ids"]:
-                                    continue
-                        if not channel:
-                            continue
-                        has_permission = False
-                        if guild := channel.guild:
-                            members = [
-                                channel.guild.me,
-                                guild.get_member(user.id)
-                            ]
-                            for member in members:
-                                if not channel.permissions_for(
-                                        member).embed_links:
-                                    break
-                                if not channel.permissions_for(
-                                        member).send_messages:
-                                    break
-                                if not channel.permissions_for(
-                                        member).use_external_emojis:
-                                    break
-                            else:
-                                has_permission = True
-                        else:
-                            has_permission = True
-                    except asyncio.TimeoutError:
-                        raise
-                    except Exception as e:
-                        self.log.exception(
-                            "Exception during evtc notificaitons", exc_info=e)
-                        continue
-                    if has_permission:
-                        try:
-                            await channel.send(embed=embed)
-                        except discord.HTTPException as e:
-                            self.log.exception(e)
-                            continue
+                if await self.post_evtc_notification(doc):
+                    self.evtc_notification_acks.append(doc["_id"])
+                else:
+                    await self.schedule_evtc_notification_retry(doc)
             except asyncio.CancelledError:
+                self.evtc_notifications_queued.discard(doc["_id"])
                 raise
-            except Exception as e:
-                self.log.exception("Exception during evtc notificaitons",
-                                   exc_info=e)
             finally:
-                await self.db.evtc.notifications.update_one(
-                    {"_id": doc["_id"]}, {"$set": {
-                        "posted": True
-                    }})
-
-    @post_evtc_notifications.before_loop
-    async def before_post_evtc_notifications(self):
-        await self.bot.wait_until_ready()
+                self.evtc_notification_queue.task_done()
+
+    async def schedule_evtc_notification_retry(self, doc):
+        attempts = doc.get("attempts", 0) + 1
+        if attempts >= EVTC_NOTIFICATION_MAX_ATTEMPTS:
+            self.log.warning("Giving up on evtc notification %s after %d "
+                             "attempts", doc["_id"], attempts)
+            self.evtc_notification_acks.append(doc["_id"])
+            return
+        try:
+            await self.db.evtc.notifications.update_one({"_id": doc["_id"]}, {
+                "$inc": {
+                    "attempts": 1
+                },
+                "$set": {
+                    "retry_at":
+                    datetime.datetime.utcnow() +
+                    EVTC_NOTIFICATION_RETRY_DELAY * attempts
+                }
+            })
+        except PyMongoError as e:
+            self.log.exception("Failed to schedule evtc notification retry",
+                               exc_info=e)
+        finally:
+            self.evtc_notifications_queued.discard(doc["_id"])
+
+    @tasks.loop(seconds=2)
+    async def flush_evtc_notification_acks(self):
+        if not self.evtc_notification_acks:
+            return
+        ids = self.evtc_notification_acks
+        self.evtc_notification_acks = []
+        acked = False
+        try:
+            await self.db.evtc.notifications.update_many(
+                {"_id": {
+                    "$in": ids
+                }}, {"$set": {
+                    "posted": True
+                }})
+            acked = True
+        except PyMongoError as e:
+            self.log.exception("Failed to ack evtc notifications",
+                               exc_info=e)
+            # Retry on the next run. The ids stay queued meanwhile so the
+            # notifications aren't posted twice
+            self.evtc_notification_acks = ids + self.evtc_notification_acks
+        finally:
+            if acked:
+                self.evtc_notifications_queued.difference_update(ids)
+
+    async def get_evtc_destinations(self, user_id):
+        destinations = self.evtc_destinations_cache.get(user_id)
+        if destinations is None:
+            destinations = await self.db.evtc.destinations.find({
+                "user_id": user_id
+            }).to_list(None)
+            self.evtc_destinations_cache.set(user_id, destinations)
+        return destinations
+
+    async def post_evtc_notification(self, doc):
+        """Post a notification to its destinations. Returns True once it's
+        done with, posted or impossible to post, and False if it should be
+        retried"""
+        try:
+            user = self.bot.get_user(doc["user_id"])
+            if not user:
+                return True
+            destinations = await self.get_evtc_destinations(user.id)
+            data = await self.get_encounter_data(doc["encounter_id"])
+            if "players" not in data:
+                # dps.report answered with an error, the log is gone
+                self.log.warning("Dropping evtc notification %s: %s",
+                                 doc["_id"], data.get("error"))
+                return True
+            recorded_by = data.get("recordedBy", None)
+            recorded_player_guild = None
+            for player in data["players"]:
+                if player["name"] == recorded_by:
+                    recorded_player_guild = player.get("guildID")
+                    break
+            embed = await self.upload_embed(None, data, doc["permalink"],
+                                            doc["encounter_id"])
+            embed.set_footer(
+                text="Autoposted by "
+                f"{user.name}#{user.discriminator}({user.id})."
+                " The bot respects the user's permissions; remove their "
+                "permission to send messages or embed "
+                "links to stop these messsages.")
+            for destination in destinations:
+                try:
+                    channel = self.bot.get_channel(destination["channel_id"])
+                    if destination[
+                            "guild_ids"] and recorded_by and recorded_player_guild:
+                        if destination["guild_ids"]:
+                            if recorded_player_guild not in destination[
+                                    "guild_ids"]:
+                                continue
+                    if not channel:
+                        continue
+                    has_permission = False
+                    if guild := channel.guild:
+                        members = [
+                            channel.guild.me,
+                            guild.get_member(user.id)
+                        ]
+                        for member in members:
+                            if not channel.permissions_for(
+                                    member).embed_links:
+                                break
+                            if not channel.permissions_for(
+                                    member).send_messages:
+                                break
+                            if not channel.permissions_for(
+                                    member).use_external_emojis:
+                                break
+                        else:
+                            has_permission = True
+                    else:
+                        has_permission = True
+                except asyncio.TimeoutError:
+                    raise
+                except Exception as e:
+                    self.log.exception(
+                        "Exception during evtc notificaitons", exc_info=e)
+                    continue
+                if has_permission:
+                    try:
+                        await channel.send(embed=embed)
+                    except discord.HTTPException as e:
+                        self.log.exception(e)
+                        continue
+            return True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.log.exception("Exception during evtc notificaitons",
+                               exc_info=e)
+        return False
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -14,7 +14,7 @@ async def guild_name_autocomplete(interaction: discord.Interaction,
                                   current: str):
     cog = interaction.command.binding
     bot = cog.bot
-    doc = await bot.database.get(interaction.user, cog)
+    doc = await cog.get_user_doc(interaction.user)
     key = doc.get("key", {})
     if not key:
         return []
@@ -40,8 +40,8 @@ async def guild_name_autocomplete(interaction: discord.Interaction,
             "last_update": datetime.datetime.utcnow(),
             "guild_list": guild_list
         }
-        await bot.database.set(interaction.user,
-                               {f"guild_cache.{account_key}": c}, cog)
+        await cog.set_user_doc(interaction.user,
+                               {f"guild_cache.{account_key}": c})
 
     choices = []
     current = current.lower()
@@ -51,7 +51,7 @@ async def guild_name_autocomplete(interaction: discord.Interaction,
         if guild_id:
             choices.append(
                 Choice(name="Server's default guild", value=guild_id))
-    doc = await bot.database.get(interaction.user, cog)
+    doc = await cog.get_user_doc(interaction.user)
     if not key:
         return choices
     cache = doc.get("guild_cache", {}).get(account_key, {})
@@ -191,59 +191,46 @@ class GeneralGuild:
             colour=await self.get_embed_color(interaction),
             title=base["name"],
         )
-        order_id = 1
-        # For each order the rank has, go through each member and add it with
-        # the current order increment to the embed
+        rank_orders = {rank["id"]: rank["order"] for rank in ranks}
+        # Filter invited members and sort by rank order, keeping the roster
+        # order within each rank
+        roster = [
+            member for member in results if member["rank"] != "invited"
+            and 1 <= rank_orders.get(member["rank"], 0) <= len(ranks)
+        ]
+        roster.sort(key=lambda member: rank_orders[member["rank"]])
+        owners = {}
+        if interaction.guild:
+            owners = await self.get_account_owners(
+                member["name"] for member in roster)
         lines = []
 
-        async def get_guild_member_mention(account_name):
-            if not interaction.guild:
-                return ""
-            cursor = self.bot.database.iter(
-                "users", {
-                    "$or": [{
-                        "cogs.GuildWars2.key.account_name": account_name
-                    }, {
-                        "cogs.GuildWars2.keys.account_name": account_name
-                    }]
-                })
-            async for doc in cursor:
-                member = interaction.guild.get_member(doc["_id"])
+        def get_guild_member_mention(account_name):
+            for user_id in owners.get(account_name, []):
+                member = interaction.guild.get_member(user_id)
                 if member:
                     return member.mention
             return ""
 
         embeds = []
-        for order in ranks:
-            for member in results:
-                # Filter invited members
-                if member['rank'] != "invited":
-                    member_rank = member['rank']
-                    # associate order from /ranks with rank from /members
-                    for rank in ranks:
-                        if member_rank == rank['id']:
-                            if rank['order'] == order_id:
-                                mention = await get_guild_member_mention(
-                                    member["name"])
-                                if mention:
-                                    mention = f" - {mention}"
-                                line = "**{}**{}\n*{}*".format(
-                                    member['name'], mention, member['rank'])
-                                if len(str(lines)) + len(line) < 6000:
-                                    lines.append(line)
-                                else:
-                                    embeds.append(
-                                        embed_list_lines(embed,
-                                                         lines,
-                                                         "> **MEMBERS**",
-                                                         inline=True))
-                                    lines = [line]
-                                    embed = discord.Embed(
-                                        title=base["name"],
-                                        colour=await
-                                        self.get_embed_color(interaction))
-
-            order_id += 1
+        for member in roster:
+            mention = get_guild_member_mention(member["name"])
+            if mention:
+                mention = f" - {mention}"
+            line = "**{}**{}\n*{}*".format(member['name'], mention,
+                                           member['rank'])
+            if len(str(lines)) + len(line) < 6000:
+                lines.append(line)
+            else:
+                embeds.append(
+                    embed_list_lines(embed,
+                                     lines,
+                                     "> **MEMBERS**",
+                                     inline=True))
+                lines = [line]
+                embed = discord.Embed(
+                    title=base["name"],
+                    colour=await self.get_embed_color(interaction))
         embeds.append(
             embed_list_lines(embed, lines, "> **MEMBERS**", inline=True))
         if len(embeds) == 1:
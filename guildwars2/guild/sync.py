@@ -306,13 +306,7 @@ class GuildSync:
         async def create(cls, cog, member) -> GuildSync.SyncTarget:
             self = cls()
             self.member = member
-            doc = await cog.bot.database.get(member, cog)
-            keys = doc.get("keys", [])
-            if not keys:
-                key = doc.get("key")
-                if key:
-                    keys.append(key)
-            self.accounts = {key["account_name"] for key in keys}
+            self.accounts = set(await cog.get_linked_accounts(member))
             self.is_in_any_guild = False
             return self
 
@@ -423,7 +417,7 @@ class GuildSync:
         await gs.synchronize_roles()
         if user:
             await gs.fetch_members()
-            user_doc = await self.bot.database.get(user, self)
+            user_doc = await self.get_user_doc(user)
             keys = user_doc.get("keys", [])
             if not keys:
                 key = user_doc.get("key")
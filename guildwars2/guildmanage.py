@@ -179,7 +179,7 @@ class GuildManageMixin:
             role = guild.get_role(doc["key_sync"]["role"])
         if not role:
             return
-        user_doc = await self.bot.database.get(member, self)
+        user_doc = await self.get_user_doc(member)
         has_key = False
         if user_doc.get("key", {}).get("key"):
             has_key = True
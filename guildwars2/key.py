@@ -17,7 +17,7 @@ class KeyMixin:
     async def key_add(self, interaction: discord.Interaction, token: str):
         """Adds a key and associates it with your discord account"""
         await interaction.response.defer(ephemeral=True)
-        doc = await self.bot.database.get(interaction.user, self)
+        doc = await self.get_user_doc(interaction.user)
         try:
             endpoints = ["tokeninfo", "account"]
             token_info, acc = await self.call_multiple(endpoints, key=token)
@@ -51,8 +51,9 @@ class KeyMixin:
                 "another"
             )
         keys.append(key_doc)
-        await self.bot.database.set(
-            interaction.user, {"key": key_doc, "keys": keys}, self
+        await self.set_user_doc(interaction.user, {"key": key_doc, "keys": keys})
+        await self.update_account_links(
+            interaction.user, {"key": key_doc, "keys": keys}
         )
         if len(keys) > 1:
             output = (
@@ -113,7 +114,7 @@ class KeyMixin:
             pass
 
     async def key_autocomplete(self, interaction: discord.Interaction, current: str):
-        doc = await self.bot.database.get(interaction.user, self)
+        doc = await self.get_user_doc(interaction.user)
         current = current.lower()
         choices = []
         keys = doc.get("keys", [])
@@ -131,7 +132,7 @@ class KeyMixin:
     async def key_remove(self, interaction: discord.Interaction, token: str):
         """Remove selected keys from the bot"""
         await interaction.response.defer(ephemeral=True)
-        doc = await self.bot.database.get(interaction.user, self)
+        doc = await self.get_user_doc(interaction.user)
         keys = doc.get("keys", [])
         key = doc.get("key", {})
         to_keep = []
@@ -144,15 +145,14 @@ class KeyMixin:
             return await interaction.followup.send(
                 "No keys were removed. Invalid token"
             )
-        await self.bot.database.set(
-            interaction.user, {"key": key, "keys": to_keep}, self
-        )
+        await self.set_user_doc(interaction.user, {"key": key, "keys": to_keep})
+        await self.update_account_links(interaction.user, {"key": key, "keys": to_keep})
         await interaction.followup.send("Key removed.")
 
     @key_group.command(name="info")
     async def key_info(self, interaction: discord.Interaction):
         """Information about your api keys"""
-        doc = await self.bot.database.get(interaction.user, self)
+        doc = await self.get_user_doc(interaction.user)
         await interaction.response.defer(ephemeral=True)
         keys = doc.get("keys", [])
         key = doc.get("key", {})
@@ -169,7 +169,7 @@ class KeyMixin:
     @app_commands.autocomplete(token=key_autocomplete)
     async def key_switch(self, interaction: discord.Interaction, token: str):
         """Swaps between multiple stored API keys."""
-        doc = await self.bot.database.get(interaction.user, self)
+        doc = await self.get_user_doc(interaction.user)
         keys = doc.get("keys", [])
         key = doc.get("key", {})
         if not keys:
@@ -188,7 +188,8 @@ class KeyMixin:
             return await interaction.response.send_message(
                 "That key is not in your account.", ephemeral=True
             )
-        await self.bot.database.set(interaction.user, {"key": k}, self)
+        await self.set_user_doc(interaction.user, {"key": k})
+        await self.update_account_links(interaction.user, {"key": k, "keys": keys})
         msg = "Swapped to selected key."
         if key["name"]:
             msg += " Name : `{}`".format(k["name"])
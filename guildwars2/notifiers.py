@@ -9,9 +9,11 @@ from bs4 import BeautifulSoup
 from discord import app_commands
 from discord.app_commands import Choice
 from discord.ext import tasks
+from pymongo.errors import PyMongoError
 
 from .daily import DAILY_CATEGORIES
 from .exceptions import APIError
+from .utils.chat import chunk_embeds
 
 
 class DailyCategoriesDropdown(discord.ui.Select):
@@ -380,8 +382,8 @@ class NotiifiersMixin:
                 "No event found matching that name", ephemeral=True
             )
         reminder["time"] = minutes_before_event * 60
-        await self.bot.database.set(
-            interaction.user, {"event_reminders": reminder}, self, operator="push"
+        await self.set_user_doc(
+            interaction.user, {"event_reminders": reminder}, operator="push"
         )
         await interaction.response.send_message(
             "Reminder set succesfully", ephemeral=True
@@ -408,12 +410,12 @@ class NotiifiersMixin:
     ):
         """Get a personal reminder whenever Daily Mystic Forger becomes active."""
         await interaction.response.defer(ephemeral=True)
-        doc = await self.bot.database.get(interaction.user, self)
+        doc = await self.get_user_doc(interaction.user)
         doc = doc.get("mystic_forger", {})
         if reminder_frequency == "disable":
             if doc.get("enabled", False):
-                await self.bot.database.set(
-                    interaction.user, {"mystic_forger.enabled": False}, self
+                await self.set_user_doc(
+                    interaction.user, {"mystic_forger.enabled": False}
                 )
                 return await interaction.followup.send(
                     "Mystic Forger reminder disabled.", ephemeral=True
@@ -422,13 +424,12 @@ class NotiifiersMixin:
                 return await interaction.followup.send(
                     "Mystic Forger reminder is already disabled.", ephemeral=True
                 )
-        await self.bot.database.set(
+        await self.set_user_doc(
             interaction.user,
             {
                 "mystic_forger.enabled": True,
                 "mystic_forger.reminder_frequency": reminder_frequency,
             },
-            self,
         )
         return await interaction.followup.send(
             "Mystic Forger reminder enabled. Make sure "
@@ -583,14 +584,38 @@ class NotiifiersMixin:
         )
         return embed, text_version, minor
 
+    async def fetch_feed(self, url):
+        """Conditional GET of a polled feed. Returns the text, or None if the
+        feed hasn't changed since the last fetch, along with the new
+        validators. The caller stores those in feed_validators once it has
+        handled the text, so a feed that failed to process is fetched again"""
+        headers = {}
+        validators = self.feed_validators.get(url, {})
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        async with self.session.get(url, headers=headers) as r:
+            if r.status == 304:
+                return None, None
+            text = await r.text()
+            if r.status != 200:
+                return text, None
+            return text, {
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+            }
+
     async def check_news(self):
         doc = await self.bot.database.get_cog_config(self)
         if not doc:
             return []
         last_news = doc["cache"]["news"]
         url = "https://www.guildwars2.com/en/feed/"
-        async with self.session.get(url) as r:
-            feed = et.fromstring(await r.text())[0]
+        text, validators = await self.fetch_feed(url)
+        if text is None:
+            return []
+        feed = et.fromstring(text)[0]
         to_post = []
         if last_news:
             for item in feed.findall("item"):
@@ -609,6 +634,8 @@ class NotiifiersMixin:
                     pass
         last_news = [x.find("title").text for x in feed.findall("item")]
         await self.bot.database.set_cog_config(self, {"cache.news": last_news})
+        if validators:
+            self.feed_validators[url] = validators
         return to_post
 
     def news_embed(self, item):
@@ -638,21 +665,22 @@ class NotiifiersMixin:
             return False
 
     async def game_build_changed(self):
-        pass
+        url = "http://assetcdn.101.arenanetworks.com/latest/101"
+        some_weird_numbers, validators = await self.fetch_feed(url)
+        if some_weird_numbers is None:
+            return False
         doc = await self.bot.database.get_cog_config(self)
         if not doc:
             return False
         current_build = doc["cache"]["build"]
-        url = "http://assetcdn.101.arenanetworks.com/latest/101"
-        async with self.session.get(url) as r:
-            some_weird_numbers: str = await r.text()
         some_weird_numbers = some_weird_numbers.split()
         build = some_weird_numbers[0]
-        if current_build != build:
+        changed = current_build != build
+        if changed:
             await self.bot.database.set_cog_config(self, {"cache.build": build})
-            return True
-        else:
-            return False
+        if validators:
+            self.feed_validators[url] = validators
+        return changed
 
     @tasks.loop(time=[datetime.time(hour=23, minute=40, tzinfo=datetime.timezone.utc)])
     async def send_daily_notifs(self):
@@ -664,6 +692,28 @@ class NotiifiersMixin:
             subdocs=["daily"],
         )
         daily_doc = await self.bot.database.get_cog_config(self)
+        # Most guilds share one of a handful of configurations, so each
+        # distinct embed is only built once per run
+        embed_cache = {}
+
+        async def get_embed(categories, channel):
+            key = self.daily_embed_cache_key(categories, channel, tomorrow=True)
+            if key not in embed_cache:
+                embed = await self.daily_embed(
+                    categories, doc=daily_doc, interaction=channel, tomorrow=True
+                )
+                embed.title = "Dailies"
+                tomorrow = datetime.datetime.now(
+                    datetime.timezone.utc
+                ) + datetime.timedelta(days=1)
+                tomorrow = tomorrow.replace(hour=0, minute=0, second=0, microsecond=0)
+                embed.timestamp = tomorrow
+                embed.set_thumbnail(
+                    url="https://wiki.guildwars2.com/images/"
+                    "1/14/Daily_Achievement.png"
+                )
+                embed_cache[key] = embed
+            return embed_cache[key]
 
         async def notify_guild(doc):
             categories = doc.get("categories")
@@ -697,15 +747,7 @@ class NotiifiersMixin:
                     "to send daily "
                     "notifs!"
                 )
-            embed = await self.daily_embed(
-                categories, doc=daily_doc, interaction=channel, tomorrow=True
-            )
-            embed.title = "Dailies"
-            tomorrow = datetime.datetime.now(
-                datetime.timezone.utc
-            ) + datetime.timedelta(days=1)
-            tomorrow = tomorrow.replace(hour=0, minute=0, second=0, microsecond=0)
-            embed.timestamp = tomorrow
+            embed = await get_embed(categories, channel)
             edit = doc.get("autoedit", False)
             autodelete = doc.get("autodelete", False)
             old_message = None
@@ -717,9 +759,6 @@ class NotiifiersMixin:
                 except discord.HTTPException:
                     pass
             edited = False
-            embed.set_thumbnail(
-                url="https://wiki.guildwars2.com/images/" "1/14/Daily_Achievement.png"
-            )
             if old_message and edit:
                 try:
                     await old_message.edit(embed=embed)
@@ -798,11 +837,13 @@ class NotiifiersMixin:
                     role = channel.guild.get_role(role_id)
                     if role:
                         content = role.mention
-                for embed in embeds:
-                    if filter_on:
-                        if embed.title in filtered:
-                            continue
-                    await channel.send(content, embed=embed)
+                to_send = [
+                    embed
+                    for embed in embeds
+                    if not filter_on or embed.title not in filtered
+                ]
+                for chunk in chunk_embeds(to_send):
+                    await channel.send(content, embeds=chunk)
             except Exception as e:
                 self.log.exception(e)
 
@@ -885,21 +926,23 @@ class NotiifiersMixin:
     @tasks.loop(minutes=5)
     async def gem_tracker(self):
         cost = await self.get_gem_price()
+        if self.gem_alerts.loaded and not self.gem_alerts.triggered(cost):
+            return
         cost_coins = self.gold_to_coins(None, cost)
-        cursor = self.bot.database.iter("users", {"gemtrack": {"$ne": None}}, self)
+        cursor = self.bot.database.iter("users", {"gemtrack": {"$gt": cost}}, self)
         async for doc in cursor:
             try:
-                if cost < doc["gemtrack"]:
-                    user = doc["_obj"]
-                    user_price = self.gold_to_coins(None, doc["gemtrack"])
-                    msg = (
-                        "Hey, {.mention}! You asked to be notified "
-                        "when 400 gems were cheaper than {}. Guess "
-                        "what? They're now only "
-                        "{}!".format(user, user_price, cost_coins)
-                    )
-                    await user.send(msg)
-                    await self.bot.database.set(user, {"gemtrack": None}, self)
+                user = doc["_obj"]
+                user_price = self.gold_to_coins(None, doc["gemtrack"])
+                msg = (
+                    "Hey, {.mention}! You asked to be notified "
+                    "when 400 gems were cheaper than {}. Guess "
+                    "what? They're now only "
+                    "{}!".format(user, user_price, cost_coins)
+                )
+                await user.send(msg)
+                await self.buffer_user_update(user, {"$set": {"gemtrack": None}})
+                self.gem_alerts.remove(user.id)
             except asyncio.CancelledError:
                 return
             except Exception:
@@ -967,17 +1010,19 @@ class NotiifiersMixin:
         await self.send_population_notifs()
         await asyncio.sleep(300)
         await self.cache_endpoint("worlds", True)
+        if self.world_populations is None:
+            await self.load_world_populations()
         cursor = self.db.worlds.find({})
         date = datetime.datetime.utcnow()
+        changed = {}
         async for world in cursor:
-            doc = await self.db.worldpopulation.find_one(
-                {"world_id": world["_id"]}, sort=[("date", -1)]
-            )
             current_pop = self.population_to_int(world["population"])
-            if not doc or current_pop != doc["population"]:
-                await self.db.worldpopulation.insert_one(
-                    {"population": current_pop, "world_id": world["_id"], "date": date}
-                )
+            if current_pop != self.world_populations.get(world["_id"]):
+                changed[world["_id"]] = current_pop
+        try:
+            await self.record_populations(date, changed)
+        except PyMongoError as e:
+            self.log.exception("Failed to record world populations", exc_info=e)
 
     @world_population_checker.before_loop
     async def before_world_population_checker(self):
@@ -992,9 +1037,7 @@ class NotiifiersMixin:
             async for doc in cursor:
                 try:
                     user = await self.bot.fetch_user(doc["_id"])
-                    await self.bot.database.set_user(
-                        user, {"poptrack": wid}, self, operator="$pull"
-                    )
+                    await self.buffer_user_update(user, {"$pull": {"poptrack": wid}})
                     await user.send(msg)
                 except asyncio.CancelledError:
                     return
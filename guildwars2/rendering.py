@@ -0,0 +1,388 @@
+import asyncio
+import datetime
+import importlib.util
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageDraw, ImageFont
+
+from .utils.icons import IconCache
+
+# matplotlib is only imported by the workers that render with it
+MATPLOTLIB_AVAILABLE = importlib.util.find_spec("matplotlib") is not None
+POPULATION_LEVELS = ["Low", "Medium", "High", "Very High", "Full"]
+
+# Per-process state of the render workers, set up by _init_worker
+_worker = {}
+
+
+def _init_worker(font_path, font_size, icon_directory):
+    try:
+        _worker["font"] = ImageFont.truetype(font_path, size=font_size)
+    except IOError:
+        _worker["font"] = ImageFont.load_default()
+    _worker["icons"] = IconCache(None, icon_directory)
+
+
+class RenderService:
+    """Runs CPU bound rendering jobs in a small worker pool.
+
+    Jobs are module level functions taking picklable arguments and
+    returning PNG bytes. At most `workers` jobs run at once, and each gets
+    a timeout once it has started. After a timeout, or if a worker dies,
+    the pool is replaced.
+
+    Jobs run in threads unless processes are enabled, in which case they
+    run in a spawned process pool whose old workers are terminated when it
+    is replaced, failing any other job still running on them. Spawned
+    workers import this package afresh, so processes must only be enabled
+    if the bot's entry point is guarded by `if __name__ == "__main__":`,
+    or every worker would start the bot.
+    """
+
+    def __init__(self,
+                 font_path,
+                 font_size,
+                 icon_directory,
+                 *,
+                 workers=2,
+                 timeout=60,
+                 processes=False):
+        self.initargs = font_path, font_size, icon_directory
+        self.workers = workers
+        self.timeout = timeout
+        self.processes = processes
+        self.slots = asyncio.Semaphore(workers)
+        self.pending = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.executor = self._create_executor()
+
+    def _create_executor(self):
+        if not self.processes:
+            return ThreadPoolExecutor(max_workers=self.workers,
+                                      thread_name_prefix="render",
+                                      initializer=_init_worker,
+                                      initargs=self.initargs)
+        # Forking a process with a running event loop and driver threads
+        # isn't safe, start workers fresh instead
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=self.initargs)
+
+    def set_processes(self, enabled):
+        if enabled == self.processes:
+            return
+        self.processes = enabled
+        executor = self.executor
+        self.executor = self._create_executor()
+        # Let the jobs already running finish
+        executor.shutdown(wait=False)
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        try:
+            # Only time the job itself, not the wait for a free worker
+            async with self.slots:
+                executor = self.executor
+                try:
+                    result = await asyncio.wait_for(
+                        loop.run_in_executor(executor, func, *args),
+                        self.timeout)
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    # The hung worker would otherwise stay busy forever
+                    self._recycle(executor)
+                    raise
+                except BrokenProcessPool:
+                    self.failures += 1
+                    self._recycle(executor)
+                    raise
+                except Exception:
+                    self.failures += 1
+                    raise
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        return result
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "processes": self.processes,
+            "pending": self.pending,
+            "completed": self.completed,
+            "timeouts": self.timeouts,
+            "failures": self.failures
+        }
+
+    def _recycle(self, executor):
+        # Jobs failing at the same time all see the same broken executor,
+        # only replace it once
+        if executor is not self.executor:
+            return
+        self.executor = self._create_executor()
+        self._terminate(executor)
+
+    @staticmethod
+    def _terminate(executor):
+        # Shutting down doesn't stop jobs that are already running. Hung
+        # threads can't be stopped, they're only left behind
+        processes = getattr(executor, "_processes", None) or {}
+        processes = list(processes.values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    def shutdown(self):
+        self._terminate(self.executor)
+
+
+def render_build(job):
+    """Render the specializations and skills of a build to PNG bytes"""
+    specializations = job["specializations"]
+    skills = job["skills"]
+    if not skills and not specializations:
+        return None
+    icons = _worker["icons"]
+    image = None
+    draw = None
+    skills_size = 64 if skills else 0
+    for index, d in enumerate(specializations):
+        spec_image = render_specialization(d["spec_doc"], d["active_traits"],
+                                           d["trait_docs"], icons)
+        if not image:
+            image = Image.new(
+                "RGBA", (spec_image.width, skills_size +
+                         (spec_image.height * len(specializations))))
+            draw = ImageDraw.ImageDraw(image)
+        image.paste(spec_image,
+                    (0, skills_size + (spec_image.height * index)))
+        draw.text((5, (spec_image.height * index) + spec_image.height -
+                   35 + skills_size),
+                  d["spec_doc"]["name"],
+                  fill="#FFFFFF",
+                  font=_worker["font"])
+    crop_amount = 6
+
+    def process_skill_icon(skill_icon):
+        skill_icon = skill_icon.resize((64, 64), Image.ANTIALIAS)
+        return skill_icon.crop(
+            (crop_amount, crop_amount, skill_icon.width - crop_amount,
+             skill_icon.height - crop_amount))
+
+    if not image:
+        image = Image.new("RGBA", (645, skills_size))
+    for i, skill in enumerate(skills, start=0):
+        skill_icon = icons.get(skill["icon"], "skill", process_skill_icon)
+        space_used = skill_icon.width * len(skills)
+        empty_space = image.width - space_used
+        spacing = empty_space // (len(skills) + 1)
+        width = (i * skill_icon.width) + ((i + 1) * spacing)
+        image.paste(skill_icon, ((width), 5))
+    output = io.BytesIO()
+    image.save(output, "png")
+    return output.getvalue()
+
+
+def render_specialization(specialization, active_traits, trait_docs, icons):
+    def get_trait_image(icon_url, size):
+        def process(image):
+            image = image.crop((4, 4, image.width - 4, image.height - 4))
+            return image.resize((size, size), Image.ANTIALIAS)
+
+        return icons.get(icon_url, ("trait", size), process)
+
+    background = icons.get(specialization["background"],
+                           "spec_background",
+                           lambda image: image.crop((0, 121, 645, 256)))
+    draw = ImageDraw.ImageDraw(background)
+    polygon_points = [
+        120, 11, 167, 39, 167, 93, 120, 121, 73, 93, 73, 39, 120, 11
+    ]
+    draw.line(polygon_points, fill=(183, 190, 195), width=3)
+    mask = Image.new("RGBA", background.size, color=(0, 0, 0, 135))
+    d = ImageDraw.ImageDraw(mask)
+    d.polygon(polygon_points, fill=(0, 0, 0, 0))
+    background.paste(mask, mask=mask)
+    mask.close()
+    column = 0
+    size = (background.height - 18) // 3
+    trait_mask = Image.new("RGBA", (size, size), color=(0, 0, 0, 135))
+    for index, trait in enumerate(specialization["major_traits"]):
+        trait_doc = trait_docs[trait]
+        image = get_trait_image(trait_doc["icon"], size)
+        if trait not in active_traits:
+            image.paste(trait_mask, mask=trait_mask)
+        background.paste(image, (272 + (column * 142), 6 +
+                                 ((size + 3) * (index % 3))), image)
+        if index and not (index + 1) % 3:
+            column += 1
+        image.close()
+    trait_mask.close()
+    minor_trait_mask = Image.new("RGBA", (size, size))
+    d = ImageDraw.ImageDraw(minor_trait_mask)
+    d.polygon([13, 2, 25, 2, 35, 12, 35, 27, 21, 36, 17, 36, 3, 27, 3, 12],
+              fill=(0, 0, 0, 255))
+    for index, trait in enumerate(specialization["minor_traits"]):
+        trait_doc = trait_docs[trait]
+        image = get_trait_image(trait_doc["icon"], size)
+        background.paste(image,
+                         (272 - size - 32 + (index * 142), 6 + size + 3),
+                         minor_trait_mask)
+        image.close()
+    minor_trait_mask.close()
+    return background
+
+
+def downsample_steps(data, max_points):
+    """Reduce a sorted step series of (date, value) pairs to at most
+    max_points points. Points that don't change the value are dropped
+    first, then only the last point of each time slot is kept"""
+    if not data:
+        return []
+    steps = [data[0]]
+    for point in data[1:-1]:
+        if point[1] != steps[-1][1]:
+            steps.append(point)
+    if len(data) > 1:
+        steps.append(data[-1])
+    if len(steps) <= max_points:
+        return steps
+    start = steps[0][0]
+    # The first point is kept as is, so that the graph starts where the
+    # data does
+    slot = (steps[-1][0] - start) / max(max_points - 2, 1)
+    if not slot:
+        return steps[-max_points:]
+    downsampled = [steps[0]]
+    last_index = None
+    for point in steps[1:]:
+        index = int((point[0] - start) / slot)
+        if index == last_index:
+            downsampled[-1] = point
+        else:
+            downsampled.append(point)
+            last_index = index
+    return downsampled
+
+
+def _text_size(draw, text, font):
+    box = draw.textbbox((0, 0), text, font=font)
+    return box[2] - box[0], box[3] - box[1]
+
+
+def render_population_graph(data, width=1200, height=500):
+    """Render a population over time step chart to PNG bytes"""
+    font = _worker["font"]
+    if hasattr(font, "font_variant"):
+        label_font = font.font_variant(size=20)
+    else:
+        label_font = font
+    left, top, right, bottom = 150, 60, width - 30, height - 50
+    image = Image.new("RGBA", (width, height))
+    draw = ImageDraw.ImageDraw(image)
+    title = "Population over time"
+    title_width, _ = _text_size(draw, title, font)
+    draw.text(((width - title_width) // 2, 10),
+              title,
+              fill="#ffa600",
+              font=font)
+    levels = len(POPULATION_LEVELS) - 1
+
+    def y_of(population):
+        return bottom - (bottom - top) * population / levels
+
+    for population, label in enumerate(POPULATION_LEVELS):
+        y = y_of(population)
+        draw.line([(left, y), (right, y)], fill=(0, 0, 0, 50))
+        label_width, label_height = _text_size(draw, label, label_font)
+        draw.text((left - 10 - label_width, y - label_height // 2),
+                  label,
+                  fill="#ffa600",
+                  font=label_font)
+    start, end = data[0][0], data[-1][0]
+    span = (end - start).total_seconds() or 1
+
+    def x_of(date):
+        return left + (right - left) * (date - start).total_seconds() / span
+
+    date_format = "%H:%M" if span <= 2 * 86400 else "%Y-%m-%d"
+    ticks = 6
+    for i in range(ticks + 1):
+        date = start + datetime.timedelta(seconds=span * i / ticks)
+        x = x_of(date)
+        draw.line([(x, top), (x, bottom)], fill=(0, 0, 0, 50))
+        label = date.strftime(date_format)
+        label_width, _ = _text_size(draw, label, label_font)
+        draw.text((x - label_width // 2, bottom + 10),
+                  label,
+                  fill="#ffa600",
+                  font=label_font)
+    points = []
+    for date, population in data:
+        x, y = x_of(date), y_of(population)
+        if points:
+            points.append((x, points[-1][1]))
+        points.append((x, y))
+    if len(points) > 1:
+        draw.line(points, fill="#c12d2b", width=3)
+    draw.rectangle([(left, top), (right, bottom)], outline="#e7691e")
+    buf = io.BytesIO()
+    image.save(buf, "png")
+    return buf.getvalue()
+
+
+def render_population_graph_hq(data):
+    """Render a population over time step chart to PNG bytes with
+    matplotlib. Slower and heavier than render_population_graph"""
+    # pyplot isn't thread safe, build the figure directly
+    import matplotlib.dates as mdates
+    import matplotlib.patheffects as pe
+    from matplotlib.artist import setp
+    from matplotlib.figure import Figure
+    fig = Figure()
+    path_effects = [pe.withStroke(linewidth=1, foreground="black")]
+    ax = fig.add_subplot(111)
+    ax.set_yticks([0, 1, 2, 3, 4])
+    ax.set_yticklabels(POPULATION_LEVELS)
+    ax.set_title("Population over time",
+                 color="#ffa600",
+                 path_effects=path_effects)
+    ax.tick_params(axis="y", which="major", length=2)
+    ax.step(*zip(*data), where="post", color="#c12d2b")
+    ax.tick_params(axis="x", which="major", pad=0)
+    ax.tick_params(axis="both", labelcolor="#ffa600", color="#c12d2b")
+    ax.grid(True,
+            which="both",
+            color="black",
+            linestyle="-",
+            alpha=0.2,
+            path_effects=[
+                pe.withStroke(linewidth=1, foreground="white", alpha=0.2)
+            ])
+    ax.set_aspect(0.2 / ax.get_data_ratio())
+    setp([ax.get_xticklines(), ax.get_yticklines()], color="#ffa600")
+    for spine in ax.spines.values():
+        spine.set_edgecolor("#e7691e")
+        spine.set_path_effects(path_effects)
+    locator = mdates.AutoDateLocator(maxticks=10)
+    formatter = mdates.ConciseDateFormatter(locator)
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(formatter)
+    for tick in ax.xaxis.get_major_ticks() + ax.yaxis.get_major_ticks():
+        tick.label1.set_path_effects(path_effects)
+    buf = io.BytesIO()
+    fig.savefig(buf,
+                format="png",
+                transparent=True,
+                bbox_inches="tight",
+                dpi=300)
+    return buf.getvalue()
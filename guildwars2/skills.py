@@ -1,43 +1,133 @@
 import base64
 import collections
+import copy
 import io
 import itertools
+import json
 import math
 import re
 import struct
 
 import discord
-import requests
 from discord.ext import commands
 from discord import app_commands
 from discord.app_commands import Choice
-from PIL import Image, ImageDraw
 
+from .rendering import render_build
 from .utils.chat import cleanup_xml_tags, embed_list_lines
 from .utils.db import prepare_search
 
 CHATCODE_REGEX = re.compile(r"\[\&(?=[^\s\[\]]*\])(.*?)\]")
+CHATCODE_TYPES = [
+    "Coin", "Item", "NPC text string", "Map link", "PvP Game", "Skill",
+    "Trait", "User", "Recipe", "Wardrobe", "Outfit", "WvW objective",
+    "Build template"
+]
+# Link types previewed from a single document
+CHATCODE_COLLECTIONS = {
+    "Map link": "pois",
+    "Skill": "skills",
+    "Trait": "traits",
+    "Recipe": "recipes",
+    "Wardrobe": "skins",
+    "Outfit": "outfits"
+}
+MAX_CHATCODE_PREVIEWS = 5
 TILESERVICE_BASE_URL = "https://tiles.guildwars2.com/"
+# Bump whenever the build image layout changes to invalidate cached renders
+BUILD_RENDER_VERSION = 1
+
+
+def parse_chat_link(chatcode):
+    """Decode a chat link into its type and the ids it refers to"""
+    data = base64.b64decode(chatcode)
+    link_type = CHATCODE_TYPES[data[0] - 1]
+    link = {"type": link_type, "code": chatcode}
+    if link_type == "Item":
+        quantity, item_id = struct.unpack("<BI", data[1:5] + b"\0")
+        link.update(quantity=quantity,
+                    item_id=item_id,
+                    skin_id=None,
+                    upgrades=[],
+                    has_upgrade_data=len(data) > 5)
+        if len(data) > 5:
+            bitfield = data[5]
+            flags = []
+            # Wardrobe, upgrade 1, upgrade 2
+            for i in reversed(range(5, 8)):
+                flags.append(bool(bitfield >> i & 1))
+            if flags[2] and not flags[1]:  # Use first upgrade slut
+                flags[1] = True
+                flags[2] = False
+            offset = 0
+            if flags[0]:
+                link["skin_id"] = struct.unpack("<I", data[6:9] + b"\0")[0]
+                offset += 4
+            for upgrade in flags[1:]:
+                if not upgrade:
+                    break
+                upgrade_id = struct.unpack(
+                    "<I", data[6 + offset:9 + offset] + b"\0")[0]
+                link["upgrades"].append(upgrade_id)
+                offset += 4
+    elif link_type in CHATCODE_COLLECTIONS:
+        link["id"] = struct.unpack("<I", data[1:])[0]
+    return link
 
 
 class Build:
+    """A decoded build template. Builds are memoized by code and shared, so
+    they must not be modified once created"""
+
     def __init__(self, cog, profession, specializations, skills, code):
         self.cog = cog
-        self.specializations = specializations
-        self.skills = skills
+        self.specializations = tuple(specializations)
+        self.skills = tuple(skills)
         self.profession = profession
         self.code = code
 
+    @staticmethod
+    async def fetch_traits(cog, spec_docs):
+        trait_ids = set()
+        for spec_doc in spec_docs:
+            trait_ids.update(spec_doc["minor_traits"] +
+                             spec_doc["major_traits"])
+        docs = await cog.fetch_docs_by_id({"traits": trait_ids})
+        return docs["traits"]
+
     @classmethod
     async def from_code(cls, cog, chatcode):
+        key = "code", cog.build_render_key(chatcode)
+        build = cog.build_cache.get(key)
+        if build:
+            return build
         code = chatcode[2:-1]
         code = base64.b64decode(code)
         fields = struct.unpack("8B10H4B6H", code)
-        profession_doc = await cog.db.professions.find_one({"code": fields[1]})
+        professions = await cog.get_professions()
+        profession_doc = professions["by_code"][fields[1]]
+        spec_fields = [(spec, traits)
+                       for spec, traits in zip(*[iter(fields[2:8])] * 2)
+                       if spec]
+        spec_ids = [spec for spec, _ in spec_fields]
+        is_ranger = profession_doc["_id"] == "Ranger"
+        is_revenant = profession_doc["_id"] == "Revenant"
+        wanted = {"specializations": spec_ids}
+        if is_ranger:
+            wanted["pets"] = [fields[18], fields[19]]
+        docs = await cog.fetch_docs_by_id(wanted)
+        legends_by_code = {}
+        if is_revenant:
+            cursor = cog.db.legends.find(
+                {"code": {
+                    "$in": [fields[18], fields[19]]
+                }})
+            async for legend_doc in cursor:
+                legends_by_code[legend_doc["code"]] = legend_doc
+        specs = [docs["specializations"][spec] for spec in spec_ids]
+        all_trait_docs = await cls.fetch_traits(cog, specs)
         specializations = []
-        for spec, traits in zip(*[iter(fields[2:8])] * 2):
-            if spec == 0:
-                continue
+        for spec_doc, (_, traits) in zip(specs, spec_fields):
             bit_string = "{:3b}".format(traits)
             bit_string = bit_string.strip()
             bit_string = bit_string.zfill(6)
@@ -45,7 +135,6 @@ class Build:
                 int(bit_string[i:i + 2], 2) - 1 for i in range(0, 6, 2)
             ])
             indexes.reverse()
-            spec_doc = await cog.db.specializations.find_one({"_id": spec})
             indexes = [
                 t + i for t, i in zip(indexes, range(0, 9, 3)) if t >= 0
             ]
@@ -54,8 +143,7 @@ class Build:
                 active_traits.append(spec_doc["major_traits"][i])
             trait_docs = {}
             for trait in spec_doc["minor_traits"] + spec_doc["major_traits"]:
-                trait_docs[trait] = await cog.db.traits.find_one(
-                    {"_id": trait})
+                trait_docs[trait] = all_trait_docs.get(trait)
             specializations.append({
                 "spec_doc": spec_doc,
                 "active_traits": active_traits,
@@ -63,14 +151,12 @@ class Build:
             })
         skill_ids = []
         skills = []
-        if profession_doc["_id"] == "Ranger":
+        if is_ranger:
             for pet in [fields[18], fields[19]]:
-                pet = await cog.db.pets.find_one({"_id": pet})
-                skills.append(pet)
-        if profession_doc["_id"] == "Revenant":
+                skills.append(docs["pets"].get(pet))
+        if is_revenant:
             for legend in [fields[18], fields[19]]:
-                legend_doc = await cog.db.legends.find_one({"code": legend})
-                skill_ids.append(legend_doc["swap"])
+                skill_ids.append(legends_by_code[legend]["swap"])
         else:
             palettes = []
             for skill in fields[8:18:2]:
@@ -81,95 +167,112 @@ class Build:
                     if palette == palette_id:
                         skill_ids.append(skill_id)
                         break
+        skill_docs = await cog.fetch_docs_by_id({"skills": skill_ids})
         for skill_id in skill_ids:
-            skills.append(await cog.db.skills.find_one({"_id": skill_id}))
+            skills.append(skill_docs["skills"].get(skill_id))
         profession = await cog.get_profession(
             profession_doc["name"], [x["spec_doc"] for x in specializations])
-        return cls(cog, profession, specializations, skills, chatcode)
+        build = cls(cog, profession, specializations, skills, chatcode)
+        cog.build_cache.set(key, build)
+        return build
 
     @classmethod
     async def from_build_tab(cls, cog, build_tab):
-        profession_doc = await cog.db.professions.find_one(
-            {"_id": build_tab["build"]["profession"]})
-
-        async def get_skills(tab, terrestrial=True):
-            skills_key = "skills"
-            if not terrestrial:
-                skills_key = f"aquatic_{skills_key}"
-            skills = tab[skills_key]
-            skill_docs = []
+        key = "tab", json.dumps(build_tab["build"], sort_keys=True)
+        build = cog.build_cache.get(key)
+        if build:
+            return build
+        professions = await cog.get_professions()
+        profession_doc = professions["by_id"][build_tab["build"]["profession"]]
+        build = build_tab["build"]
+        specializations = build["specializations"]
+        if not specializations:
+            return None
+
+        def get_ids(tab, terrestrial=True):
+            prefix = "" if terrestrial else "aquatic_"
             skill_ids = []
-            legend_docs = []
-            swap_skill_docs = []
-            pet_docs = []
-            for skill in skills.values():
+            for skill in tab[prefix + "skills"].values():
                 if isinstance(skill, list):
                     skill_ids += skill
                     continue
                 skill_ids.append(skill)
+            legend_ids = [
+                legend for legend in tab.get(prefix + "legends") or []
+                if legend
+            ]
+            pet_ids = []
+            pets = tab.get("pets")
+            if pets:
+                key = "terrestrial" if terrestrial else "aquatic"
+                pet_ids = [pet for pet in pets[key] if pet]
+            return skill_ids, legend_ids, pet_ids
+
+        ids = {terrestrial: get_ids(build, terrestrial)
+               for terrestrial in (True, False)}
+        spec_ids = [
+            spec["id"] for spec in specializations if spec and spec["id"]
+        ]
+        skill_ids, legend_ids, pet_ids = (set(itertools.chain(*group))
+                                          for group in zip(*ids.values()))
+        docs = await cog.fetch_docs_by_id({
+            "specializations": spec_ids,
+            "skills": skill_ids,
+            "legends": legend_ids,
+            "pets": pet_ids
+        })
+        swap_ids = {legend["swap"] for legend in docs["legends"].values()}
+        swap_ids -= docs["skills"].keys()
+        if swap_ids:
+            swap_docs = await cog.fetch_docs_by_id({"skills": swap_ids})
+            docs["skills"].update(swap_docs["skills"])
+
+        def get_skills(terrestrial=True):
+            skill_ids, legend_ids, pet_ids = ids[terrestrial]
+            skill_docs = []
+            legend_docs = []
+            swap_skill_docs = []
             for skill_id in skill_ids:
-                skill_doc = await cog.db.skills.find_one({"_id": skill_id})
+                skill_doc = docs["skills"].get(skill_id)
                 if not skill_doc:
                     continue
+                skill_doc = dict(skill_doc)
                 for palette_id, skill_id_2 in profession_doc[
                         "skills_by_palette"]:
                     if skill_id == skill_id_2:
                         skill_doc["palette_id"] = palette_id
                         break
                 skill_docs.append(skill_doc)
-            legends_key = "legends"
-            if not terrestrial:
-                legends_key = f"aquatic_{legends_key}"
-            legends = tab.get(legends_key)
-            if legends:
-                for legend in legends:
-                    if legend:
-                        legend_doc = await cog.db.legends.find_one(
-                            {"_id": legend})
-                        if not legend_doc:
-                            continue
-                        swap_skill_docs.append(await cog.db.skills.find_one(
-                            {"_id": legend_doc["swap"]}))
-                        utility_palettes = []
-                        for utility_skill in legend_doc["utilities"]:
-                            for palette_id, skill_id_2 in profession_doc[
-                                    "skills_by_palette"]:
-                                if skill_id == skill_id_2:
-                                    skill_doc["palette_id"] = palette_id
-                                    break
-                        legend_doc["utility_palettes"] = utility_palettes
-                        legend_docs.append(legend_doc)
-            pets = tab.get("pets")
-            if pets:
-                key = "terrestrial" if terrestrial else "aquatic"
-                for pet in pets[key]:
-                    if pet:
-                        pet_docs.append(await
-                                        cog.db.pets.find_one({"_id": pet}))
-
+            for legend in legend_ids:
+                legend_doc = docs["legends"].get(legend)
+                if not legend_doc:
+                    continue
+                swap_skill_docs.append(docs["skills"].get(legend_doc["swap"]))
+                legend_doc = dict(legend_doc, utility_palettes=[])
+                legend_docs.append(legend_doc)
+            pet_docs = [docs["pets"].get(pet) for pet in pet_ids]
             Skills = collections.namedtuple(
                 "Skills",
                 ["skill_docs", "legend_docs", "swap_skill_docs", "pet_docs"])
             return Skills(skill_docs, legend_docs, swap_skill_docs, pet_docs)
 
-        build = build_tab["build"]
-        specializations = build["specializations"]
-        if not specializations:
-            return None
+        spec_docs = [
+            docs["specializations"][spec_id] for spec_id in spec_ids
+            if spec_id in docs["specializations"]
+        ]
+        all_trait_docs = await cls.fetch_traits(cog, spec_docs)
         specs = []
         for spec in specializations:
             if not spec:
                 continue
             if spec["id"] == 0:
                 continue
-            spec_doc = await cog.db.specializations.find_one(
-                {"_id": spec["id"]})
+            spec_doc = docs["specializations"].get(spec["id"])
             if not spec_doc:
                 continue
             trait_docs = {}
             for trait in spec_doc["minor_traits"] + spec_doc["major_traits"]:
-                trait_docs[trait] = await cog.db.traits.find_one(
-                    {"_id": trait})
+                trait_docs[trait] = all_trait_docs.get(trait)
             specs.append({
                 "spec_doc": spec_doc,
                 "trait_docs": trait_docs,
@@ -178,8 +281,8 @@ class Build:
         profession = await cog.get_profession(build["profession"],
                                               [x["spec_doc"] for x in specs])
         profession_code = profession_doc["code"]
-        terrestrial = await get_skills(build)
-        aquatic = await get_skills(build, False)
+        terrestrial = get_skills()
+        aquatic = get_skills(False)
         fields = [13, profession_code]
         for spec in specs + [None] * (3 - len(specs)):
             if not spec:
@@ -236,115 +339,102 @@ class Build:
             skills = terrestrial.swap_skill_docs
         if profession_doc["_id"] == "Ranger":
             skills = terrestrial.pet_docs + terrestrial.skill_docs
+        build = cls(cog, profession, specs, skills, code)
+        cog.build_cache.set(key, build)
+        return build
 
-        return cls(cog, profession, specs, skills, code)
+    def render_job(self):
+        """The picklable subset of the build needed to render it"""
+        specializations = []
+        for d in self.specializations:
+            spec_doc = d["spec_doc"]
+            traits = spec_doc["major_traits"] + spec_doc["minor_traits"]
+            specializations.append({
+                "spec_doc": {
+                    key: spec_doc[key]
+                    for key in ("name", "background", "major_traits",
+                                "minor_traits")
+                },
+                "active_traits": d["active_traits"],
+                "trait_docs": {
+                    trait: {
+                        "icon": d["trait_docs"][trait]["icon"]
+                    }
+                    for trait in traits
+                }
+            })
+        return {
+            "specializations": specializations,
+            "skills": [{
+                "icon": skill["icon"]
+            } for skill in self.skills]
+        }
 
-    def __render(self, filename):
-        if not self.skills and not self.specializations:
-            return None
-        session = requests.Session()
-        image = None
-        draw = None
-        skills_size = 64 if self.skills else 0
-        for index, d in enumerate(self.specializations):
-            spec_image = self.render_specialization(d["spec_doc"],
-                                                    d["active_traits"],
-                                                    d["trait_docs"], session)
-            if not image:
-                image = Image.new(
-                    "RGBA", (spec_image.width, skills_size +
-                             (spec_image.height * len(self.specializations))))
-                draw = ImageDraw.ImageDraw(image)
-            image.paste(spec_image,
-                        (0, skills_size + (spec_image.height * index)))
-            draw.text((5, (spec_image.height * index) + spec_image.height -
-                       35 + skills_size),
-                      d["spec_doc"]["name"],
-                      fill="#FFFFFF",
-                      font=self.cog.font)
-        #try:
-        crop_amount = 6
-        if not image:
-            image = Image.new("RGBA", (645, skills_size))
-        for i, skill in enumerate(self.skills, start=0):
-            resp = session.get(skill["icon"])
-            skill_icon = Image.open(io.BytesIO(resp.content))
-            skill_icon = skill_icon.resize((64, 64), Image.ANTIALIAS)
-            skill_icon = skill_icon.crop(
-                (crop_amount, crop_amount, skill_icon.width - crop_amount,
-                 skill_icon.height - crop_amount))
-            space_used = skill_icon.width * len(self.skills)
-            empty_space = image.width - space_used
-            spacing = empty_space // (len(self.skills) + 1)
-            width = (i * skill_icon.width) + ((i + 1) * spacing)
-            image.paste(skill_icon, ((width), 5))
-
-    #   except Exception as e:
-    #      self.cog.log.exception("Exception displayking skills: ",
-    #                           exc_info=e)
-        session.close()
-        output = io.BytesIO()
-        image.save(output, "png")
-        output.seek(0)
-        file = discord.File(output, filename)
-        return file
+    def icon_urls(self):
+        urls = [skill["icon"] for skill in self.skills]
+        for d in self.specializations:
+            spec_doc = d["spec_doc"]
+            urls.append(spec_doc["background"])
+            for trait in spec_doc["major_traits"] + spec_doc["minor_traits"]:
+                urls.append(d["trait_docs"][trait]["icon"])
+        return urls
 
     async def render(self, *, filename="specializations.png"):
-        return await self.cog.bot.loop.run_in_executor(None, self.__render,
-                                                       filename)
-
-    @staticmethod
-    def render_specialization(specialization, active_traits, trait_docs,
-                              session):
-        def get_trait_image(icon_url, size):
-            resp = session.get(icon_url)
-            image = Image.open(io.BytesIO(resp.content))
-            image = image.crop((4, 4, image.width - 4, image.height - 4))
-            return image.resize((size, size), Image.ANTIALIAS)
-
-        resp = session.get(specialization["background"])
-        background = Image.open(io.BytesIO(resp.content))
-        background = background.crop((0, 121, 645, 256))
-        draw = ImageDraw.ImageDraw(background)
-        polygon_points = [
-            120, 11, 167, 39, 167, 93, 120, 121, 73, 93, 73, 39, 120, 11
-        ]
-        draw.line(polygon_points, fill=(183, 190, 195), width=3)
-        mask = Image.new("RGBA", background.size, color=(0, 0, 0, 135))
-        d = ImageDraw.ImageDraw(mask)
-        d.polygon(polygon_points, fill=(0, 0, 0, 0))
-        background.paste(mask, mask=mask)
-        mask.close()
-        column = 0
-        size = (background.height - 18) // 3
-        trait_mask = Image.new("RGBA", (size, size), color=(0, 0, 0, 135))
-        for index, trait in enumerate(specialization["major_traits"]):
-            trait_doc = trait_docs[trait]
-            image = get_trait_image(trait_doc["icon"], size)
-            if trait not in active_traits:
-                image.paste(trait_mask, mask=trait_mask)
-            background.paste(image, (272 + (column * 142), 6 +
-                                     ((size + 3) * (index % 3))), image)
-            if index and not (index + 1) % 3:
-                column += 1
-            image.close()
-        trait_mask.close()
-        minor_trait_mask = Image.new("RGBA", (size, size))
-        d = ImageDraw.ImageDraw(minor_trait_mask)
-        d.polygon([13, 2, 25, 2, 35, 12, 35, 27, 21, 36, 17, 36, 3, 27, 3, 12],
-                  fill=(0, 0, 0, 255))
-        for index, trait in enumerate(specialization["minor_traits"]):
-            trait_doc = trait_docs[trait]
-            image = get_trait_image(trait_doc["icon"], size)
-            background.paste(image,
-                             (272 - size - 32 + (index * 142), 6 + size + 3),
-                             minor_trait_mask)
-            image.close()
-        minor_trait_mask.close()
-        return background
+        cached = await self.cog.get_build_render(self.code)
+        if cached:
+            image = cached["image"]
+        else:
+            await self.cog.icon_cache.prefetch(self.icon_urls())
+            image = await self.cog.renderer.run(render_build,
+                                                self.render_job())
+            # Empty builds have nothing to render
+            if image:
+                await self.cog.save_build_render(self.code, image,
+                                                 self.profession)
+        if not image:
+            return None
+        return discord.File(io.BytesIO(image), filename)
 
 
 class SkillsMixin:
+    def build_render_key(self, code):
+        code = base64.b64encode(base64.b64decode(code[2:-1])).decode()
+        font = getattr(self.font, "path", "default")
+        return f"{BUILD_RENDER_VERSION}:{font}:{code}"
+
+    async def get_build_render(self, code):
+        """Return the cached render of a build chat code, if any"""
+        key = self.build_render_key(code)
+        doc = self.build_render_cache.get(key)
+        if doc is None:
+            doc = await self.db.build_renders.find_one({"_id": key})
+            if doc and doc.get("image"):
+                self.build_render_cache.set(key, doc)
+        if not doc or not doc.get("image"):
+            return None
+        return doc
+
+    @commands.command(name="renderstats")
+    @commands.is_owner()
+    async def render_stats(self, ctx):
+        """Show render service statistics"""
+        stats = self.renderer.stats()
+        await ctx.send("\n".join(f"{k}: {v}" for k, v in stats.items()))
+
+    async def save_build_render(self, code, image, profession):
+        key = self.build_render_key(code)
+        doc = {
+            "_id": key,
+            "image": image,
+            "profession": {
+                "name": profession.name,
+                "icon": profession.icon,
+                "color": profession.color.value
+            }
+        }
+        self.build_render_cache.set(key, doc)
+        await self.db.build_renders.replace_one({"_id": key}, doc, upsert=True)
+
     async def skill_autocomplete(self,
                                          interaction: discord.Interaction,
                                          current: str):
@@ -408,7 +498,7 @@ class SkillsMixin:
         data = await self.skill_embed(choice, interaction)
         await interaction.followup.send(embed=data)
 
-    async def skill_embed(self, skill, ctx):
+    async def skill_embed(self, skill, ctx, *, color=None):
         def get_skill_type():
             slot = skill["slot"]
             if slot.startswith("Weapon"):
@@ -465,15 +555,13 @@ class SkillsMixin:
             description = cleanup_xml_tags(skill["description"])
             for tup in replacement_attrs:
                 description = re.sub(*tup, description)
-        url = "https://wiki.guildwars2.com/wiki/" + skill["name"].replace(
-            ' ', '_')
-        async with self.session.head(url) as r:
-            if not r.status == 200:
-                url = None
+        url = await self.get_wiki_url(skill["name"])
+        if color is None:
+            color = await self.get_embed_color(ctx)
         data = discord.Embed(title=skill["name"],
                              description=description,
                              url=url,
-                             color=await self.get_embed_color(ctx))
+                             color=color)
         # TODO add profession colors and racial colors
         if "icon" in skill:
             data.set_thumbnail(url=skill["icon"])
@@ -711,241 +799,258 @@ class SkillsMixin:
             self.chatcode_preview_opted_out_guilds.add(doc["_id"])
 
     async def get_wiki_url(self, name):
+        if name in self.wiki_url_cache:
+            return self.wiki_url_cache.get(name)
         url = "https://wiki.guildwars2.com/wiki/" + name.replace(' ', '_')
         async with self.session.head(url) as r:
             if not r.status == 200:
                 url = None
+        self.wiki_url_cache.set(name, url)
         return url
 
+    async def fetch_chat_link_docs(self, links):
+        wanted = collections.defaultdict(set)
+        for link in links:
+            if link["type"] == "Item":
+                wanted["items"].add(link["item_id"])
+                wanted["items"].update(link["upgrades"])
+                if link["skin_id"] is not None:
+                    wanted["skins"].add(link["skin_id"])
+            elif link["type"] in CHATCODE_COLLECTIONS:
+                wanted[CHATCODE_COLLECTIONS[link["type"]]].add(link["id"])
+        docs = await self.fetch_docs_by_id(wanted)
+        # Recipes need a second round for their output and ingredients
+        item_ids = set()
+        for recipe in docs["recipes"].values():
+            item_ids.add(recipe["output_item_id"])
+            for ingredient in recipe.get("ingredients", []):
+                item_ids.add(ingredient["item_id"])
+        item_ids -= docs["items"].keys()
+        if item_ids:
+            items = await self.fetch_docs_by_id({"items": item_ids})
+            docs["items"].update(items["items"])
+        return docs
+
+    async def chat_link_embed(self, link, docs, message, can_use_emojis):
+        """Build the preview of a parsed chat link. Returns the embed and,
+        for build templates, the image file"""
+        embed = discord.Embed(title=link["type"],
+                              color=self.embed_color,
+                              description="Chat link preview")
+        match link["type"]:
+            case "Item":
+                item_doc = docs["items"].get(link["item_id"])
+                if not item_doc:
+                    return None, None
+                embed.title = item_doc["name"]
+                embed.set_thumbnail(url=item_doc["icon"])
+                embed.color = int(
+                    self.gamedata["items"]["rarity_colors"][
+                        item_doc["rarity"]], 16)
+                suffix = ""
+                wiki_url = await self.get_wiki_url(item_doc["name"])
+                if wiki_url:
+                    embed.url = wiki_url
+                if link["skin_id"] is not None:
+                    skin_doc = docs["skins"].get(link["skin_id"])
+                    if not skin_doc:
+                        name = "Unknown"
+                    else:
+                        name = skin_doc["name"]
+                        embed.set_thumbnail(url=skin_doc["icon"])
+                    embed.add_field(name="Skin", value=name)
+                upgrades = []
+                for upgrade_id in link["upgrades"]:
+                    upgrade_doc = docs["items"].get(upgrade_id)
+                    if not upgrade_doc:
+                        upgrades.append("Unknown upgrade")
+                        continue
+                    upgrades.append(upgrade_doc["name"])
+                    if not suffix:
+                        suffix = upgrade_doc["details"].get("suffix", "")
+                if upgrades:
+                    field_name = "Upgrades" if len(
+                        upgrades) > 1 else "Upgrade"
+                    embed.add_field(name=field_name,
+                                    value="\n".join(upgrades))
+                if link["has_upgrade_data"]:
+                    embed.title = f"{embed.title} {suffix}"
+                if link["quantity"] > 1:
+                    embed.title = f"{link['quantity']} {embed.title}"
+                return embed, None
+            case "Map link":
+                poi_doc = docs["pois"].get(link["id"])
+                if not poi_doc:
+                    return None, None
+                # TODO More detail
+                poi_type = poi_doc["type"].title()
+                if poi_type == "Landmark":
+                    poi_type = "Point of Interest"
+                emoji = self.get_emoji(message, poi_type)
+                embed.add_field(name=emoji + poi_type,
+                                value=poi_doc.get("name", "Unnamed"))
+                return embed, None
+            case "Skill" | "Trait":
+                collection = CHATCODE_COLLECTIONS[link["type"]]
+                doc = docs[collection].get(link["id"])
+                if not doc:
+                    return None, None
+                # Previews are cached and shown to everyone, so they don't
+                # use the poster's embed color
+                embed = await self.skill_embed(doc,
+                                               message,
+                                               color=self.embed_color)
+                return embed, None
+            case "Recipe":
+                recipe_doc = docs["recipes"].get(link["id"])
+                if not recipe_doc:
+                    return None, None
+                output = docs["items"].get(recipe_doc["output_item_id"])
+                if output:
+                    count = recipe_doc["output_item_count"]
+                    name = output["name"]
+                    embed.title = f"Recipe: {count} {name}"
+                disciplines = recipe_doc.get("disciplines", [])
+                if can_use_emojis:
+                    value = []
+                    for disc in disciplines:
+                        value.append(self.get_emoji(message, disc))
+                    value = "".join(value)
+                else:
+                    value = "\n".join(disciplines)
+                if value:
+                    embed.add_field(name="Crafting disciplines", value=value)
+                ingredients = recipe_doc.get("ingredients", [])
+                value = []
+                for ingredient in ingredients:
+                    item_doc = docs["items"].get(ingredient["item_id"])
+                    if item_doc:
+                        name = item_doc["name"]
+                        count = ingredient["count"]
+                        value.append(f"{count} {name}")
+                value = "\n".join(value)
+                if value:
+                    embed.add_field(name="Ingredients", value=value)
+                return embed, None
+            case "Wardrobe" | "Outfit":
+                collection = CHATCODE_COLLECTIONS[link["type"]]
+                doc = docs[collection].get(link["id"])
+                if not doc:
+                    return None, None
+                embed.set_thumbnail(url=doc["icon"])
+                embed.title = doc["name"]
+                return embed, None
+            case "Build template":
+                filename = f"build_{link['index']}.png"
+                cached = await self.get_build_render(link["code"])
+                if cached:
+                    file = discord.File(io.BytesIO(cached["image"]),
+                                        filename)
+                    profession = cached["profession"]
+                    embed.color = discord.Color(profession["color"])
+                    embed.set_thumbnail(url=profession["icon"])
+                else:
+                    build = await Build.from_code(self, link["code"])
+                    file = await build.render(filename=filename)
+                    if not file:
+                        return None, None
+                    embed.color = build.profession.color
+                    embed.set_thumbnail(url=build.profession.icon)
+                embed.set_image(url=f"attachment://{file.filename}")
+                return embed, file
+        # Coin, NPC text string, PvP Game, User and WvW objective links
+        # aren't previewed
+        return None, None
+
     @commands.Cog.listener("on_message")
     async def find_chatcodes(self, message : discord.Message):
+        if not message.content or "[&" not in message.content:
+            return
         if message.guild:
             if message.guild.id in self.chatcode_preview_opted_out_guilds:
                 return
-        if not message.content:
-            return
         if message.author.bot:
             return
-        match = re.search(CHATCODE_REGEX, message.content)
-        if not match:
+        chatcodes = []
+        for match in CHATCODE_REGEX.finditer(message.content):
+            if match.group() not in chatcodes:
+                chatcodes.append(match.group())
+            if len(chatcodes) == MAX_CHATCODE_PREVIEWS:
+                break
+        links = []
+        for chatcode in chatcodes:
+            try:
+                link = parse_chat_link(chatcode)
+            except Exception:
+                continue
+            link["index"] = len(links)
+            links.append(link)
+        if not links:
             return
-        chatcode = match.group()
+        if message.guild:
+            me = message.guild.me
+        else:
+            me = self.bot.user
+        permissions = message.channel.permissions_for(me)
+        can_use_emojis = permissions.external_emojis
+        reference = None
+        if permissions.read_message_history:
+            reference = message
+        embeds = []
+        files = []
         try:
-            data = base64.b64decode(chatcode)
-            header = struct.unpack("B", data[:1])
-            header = header[0] - 1
-            types = [
-                "Coin", "Item", "NPC text string", "Map link", "PvP Game",
-                "Skill", "Trait", "User", "Recipe", "Wardrobe", "Outfit",
-                "WvW objective", "Build template"
-            ]
-            link_type = types[header]
-            embed = discord.Embed(title=link_type, color=self.embed_color)
-            embed.set_author(name=message.author.display_name,
-                             icon_url=message.author.display_avatar.url)
-            if message.guild:
-                embed.set_footer(text=(
-                    "Server admins can opt out of chat link "
-                    "previewing by using the \"/server preview_chat_links\" command"),
-                                 icon_url=self.bot.user.display_avatar.url)
-            else:
-                embed.set_footer(icon_url=self.bot.user.display_avatar.url)
-            embed.description = "Chat link preview"
-            reference = None
-            if message.guild:
-                me = message.guild.me
-            else:
-                me = self.bot.user
-            if message.channel.permissions_for(me).read_message_history:
-                reference = message
-            match link_type:
-                case "Coin":
-                    # Currently disabled
-                    return
-                case "Item":
-                    quantity, item_id = struct.unpack("<BI", data[1:5] + b"\0")
-                    item_doc = await self.fetch_item(item_id)
-                    if not item_doc:
-                        return
-                    embed.title = item_doc["name"]
-                    embed.set_thumbnail(url=item_doc["icon"])
-                    embed.color = int(
-                        self.gamedata["items"]["rarity_colors"][
-                            item_doc["rarity"]], 16)
-                    suffix = ""
-                    wiki_url = await self.get_wiki_url(item_doc["name"])
-                    if wiki_url:
-                        embed.url = wiki_url
-                    if len(data) > 5:
-                        bitfield = struct.unpack("<B", data[5:6])
-                        bitfield = bitfield[0]
-                        flags = []
-                        # Wardrobe, upgrade 1, upgrade 2
-                        for i in reversed(range(5, 8)):
-                            flags.append(bool(bitfield >> i & 1))
-                        if flags[2] and not flags[1]:  # Use first upgrade slut
-                            flags[1] = True
-                            flags[2] = False
-                        offset = 0
-                        if flags[0]:
-                            skin_id = struct.unpack("<I", data[6:9] + b"\0")
-                            skin_id = skin_id[0]
-                            skin_doc = await self.db.skins.find_one(
-                                {"_id": skin_id})
-                            if not skin_doc:
-                                name = "Unknown"
-                            else:
-                                name = skin_doc["name"]
-                            embed.set_thumbnail(url=skin_doc["icon"])
-                            embed.add_field(name="Skin", value=name)
-                            offset += 4
-                        upgrades = []
-                        for upgrade in flags[1:]:
-                            if not upgrade:
-                                break
-                            upgrade_id = struct.unpack(
-                                "<I", data[6 + offset:9 + offset] + b"\0")
-                            upgrade_id = upgrade_id[0]
-                            upgrade_doc = await self.db.items.find_one(
-                                {"_id": upgrade_id})
-                            if not upgrade_doc:
-                                upgrades.append("Unknown upgrade")
-                                continue
-                            else:
-                                upgrades.append(upgrade_doc["name"])
-                            if not suffix:
-                                suffix = upgrade_doc["details"].get("suffix", "")
-                            offset += 4
-                        if upgrades:
-                            field_name = "Upgrades" if len(
-                                upgrades) > 1 else "Upgrade"
-                            embed.add_field(name=field_name,
-                                            value="\n".join(upgrades))
-                        embed.title = f"{embed.title} {suffix}"
-                    if quantity > 1:
-                        embed.title = f"{quantity} {embed.title}"
-                    return await message.channel.send(embed=embed, reference=reference, mention_author=False)
-                case "NPC text string":
-                    # Currently disabled
-                    return
-                case "Map link":
-                    data = struct.unpack("<I", data[1:])
-                    poi_id = data[0]
-                    poi_doc = await self.db.pois.find_one({"_id": poi_id})
-                    # continent_id = poi_doc["continent_id"]
-                    # floor = poi_doc["floor"]
-                    # x, y = [int(i) for i in poi_doc["coord"]]
-                    # tile_url = TILESERVICE_BASE_URL + f"{continent_id}/{floor}/3/{x}/{y}.jpg"
-                    # async with self.session.get(tile_url) as r:
-                    #     image = io.BytesIO(await r.read())
-                    # image.seek(0)
-                    # print(tile_url)
-                    # file = discord.File(image, "tile.jpg")
-                    # embed.set_image(url=f"attachment://{file.filename}")
-                    # await message.channel.send(file=file)
-                    # API SUCKS
-                    # TODO More detail
-                    poi_type = poi_doc["type"].title()
-                    if poi_type == "Landmark":
-                        poi_type = "Point of Interest"
-                    emoji = self.get_emoji(message, poi_type)
-                    embed.add_field(name=emoji + poi_type,
-                                    value=poi_doc.get("name", "Unnamed"))
-                    return await message.channel.send(embed=embed, reference=reference, mention_author=False)
-                case "PvP Game":
-                    # Can't do much here
-                    return
-                case "Skill":
-                    data = struct.unpack("<I", data[1:])
-                    skill_id = data[0]
-                    skill_doc = await self.db.skills.find_one({"_id": skill_id})
-                    if not skill_doc:
-                        return
-                    new_embed = await self.skill_embed(skill_doc, message)
-                    new_embed.set_footer(text=embed.footer.text,
-                                        icon_url=embed.footer.icon_url)
-                    return await message.channel.send(embed=new_embed, reference=reference, mention_author=False)
-                case "Trait":
-                    data = struct.unpack("<I", data[1:])
-                    trait_id = data[0]
-                    trait_doc = await self.db.traits.find_one({"_id": trait_id})
-                    if not trait_doc:
-                        return
-                    new_embed = await self.skill_embed(trait_doc, message)
-                    new_embed.set_footer(text=embed.footer.text,
-                                         icon_url=embed.footer.icon_url)
-                    return await message.channel.send(embed=new_embed, reference=reference, mention_author=False)
-                case "User":
-                    # Can't do much
-                    return
-                case "Recipe":
-                    data = struct.unpack("<I", data[1:])
-                    recipe_id = data[0]
-                    recipe_doc = await self.db.recipes.find_one({"_id": recipe_id})
-                    if not recipe_doc:
-                        return
-                    output = await self.fetch_item(recipe_doc["output_item_id"])
-                    if output:
-                        count = recipe_doc["output_item_count"]
-                        name = output["name"]
-                        embed.title = f"Recipe: {count} {name}"
-                    emojis = message.channel.permissions_for(me).external_emojis
-                    disciplines = recipe_doc.get("disciplines", [])
-                    if emojis:
-                        value = []
-                        for disc in disciplines:
-                            value.append(self.get_emoji(message, disc))
-                        value = "".join(value)
-                    else:
-                        value = "\n".join(disciplines)
-                    if value:
-                        embed.add_field(name="Crafting disciplines", value=value)
-                    ingredients = recipe_doc.get("ingredients", [])
-                    value = []
-                    for ingredient in ingredients:
-                        item_doc = await self.fetch_item(ingredient["item_id"])
-                        if item_doc:
-                            name = item_doc["name"]
-                            count = ingredient["count"]
-                            value.append(f"{count} {name}")
-                    value = "\n".join(value)
-                    if value:
-                        embed.add_field(name="Ingredients", value=value)
-                    return await message.channel.send(embed=embed, reference=reference, mention_author=False)
-                case "Wardrobe":
-                    data = struct.unpack("<I", data[1:])
-                    skin_id = data[0]
-                    skin_doc = await self.db.skins.find_one({"_id": skin_id})
-                    if not skin_doc:
-                        return
-                    embed.set_thumbnail(url=skin_doc["icon"])
-                    embed.title = skin_doc["name"]
-                    return await message.channel.send(embed=embed, reference=reference, mention_author=False)
-                case "Outfit":
-                    data = struct.unpack("<I", data[1:])
-                    outfit_id = data[0]
-                    outfit_doc = await self.db.outfits.find_one({"_id": outfit_id})
-                    if not outfit_doc:
-                        return
-                    embed.set_thumbnail(url=outfit_doc["icon"])
-                    embed.title = outfit_doc["name"]
-                    return await message.channel.send(embed=embed, reference=reference, mention_author=False)
-                case "WvW objective":
-                    # TODO
-                    return
-                case "Build template":
-                    build = await Build.from_code(self, chatcode)
-                    file = await build.render()
-                    embed.color = build.profession.color
-                    embed.set_thumbnail(url=build.profession.icon)
-                    embed.set_image(url=f"attachment://{file.filename}")
-                    return await message.channel.send(embed=embed, reference=reference, file=file, mention_author=False)
+            docs = None
+            for link in links:
+                key = link["code"], can_use_emojis
+                embed = None
+                file = None
+                cached = self.chat_link_preview_cache.get(key)
+                if cached:
+                    embed = discord.Embed.from_dict(copy.deepcopy(cached))
+                else:
+                    if docs is None:
+                        docs = await self.fetch_chat_link_docs(links)
+                    try:
+                        embed, file = await self.chat_link_embed(
+                            link, docs, message, can_use_emojis)
+                    except Exception as e:
+                        self.log.exception("Error previewing chat link",
+                                           exc_info=e)
+                        continue
+                    if embed and not file:
+                        self.chat_link_preview_cache.set(
+                            key, embed.to_dict())
+                if not embed:
+                    continue
+                if not embed.author.name:
+                    embed.set_author(
+                        name=message.author.display_name,
+                        icon_url=message.author.display_avatar.url)
+                if message.guild:
+                    embed.set_footer(text=(
+                        "Server admins can opt out of chat link "
+                        "previewing by using the \"/server preview_chat_links\" command"),
+                                     icon_url=self.bot.user.display_avatar.url)
+                else:
+                    embed.set_footer(
+                        icon_url=self.bot.user.display_avatar.url)
+                embeds.append(embed)
+                if file:
+                    files.append(file)
+            if embeds:
+                await message.channel.send(embeds=embeds,
+                                           files=files or None,
+                                           reference=reference,
+                                           mention_author=False)
         except Exception as e:
-            self.log.exception(exc_info=e)
-            pass
+            self.log.exception("Error previewing chat link", exc_info=e)
         finally:
-            field_id = link_type.replace(" ", "_").lower()
-            await self.bot.database.db.statistics.gw2.update_one(
-                {"_id": "link_previews"}, {"$inc": {
-                    field_id: 1
-                }}, upsert=True)
+            counts = collections.Counter(
+                link["type"].replace(" ", "_").lower() for link in links)
+            try:
+                await self.bot.database.db.statistics.gw2.update_one(
+                    {"_id": "link_previews"}, {"$inc": dict(counts)},
+                    upsert=True)
+            except Exception as e:
+                self.log.exception("Error saving chat link statistics",
+                                   exc_info=e)
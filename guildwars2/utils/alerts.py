@@ -0,0 +1,38 @@
+import bisect
+
+
+class PriceAlertIndex:
+    """Threshold-sorted index of price alerts.
+
+    Watchers are notified when the price drops below their threshold, so
+    the alerts that fire for a price are always a suffix of the sorted list.
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._thresholds = {}
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._thresholds)
+
+    def set(self, watcher, threshold):
+        self.remove(watcher)
+        if not threshold:
+            return
+        bisect.insort(self._entries, (threshold, watcher))
+        self._thresholds[watcher] = threshold
+
+    def remove(self, watcher):
+        threshold = self._thresholds.pop(watcher, None)
+        if threshold is None:
+            return
+        index = bisect.bisect_left(self._entries, (threshold, watcher))
+        if index < len(self._entries) and self._entries[index] == (threshold,
+                                                                   watcher):
+            del self._entries[index]
+
+    def triggered(self, price):
+        """Return the watchers whose threshold is above the given price"""
+        index = bisect.bisect_right(self._entries, (price, float("inf")))
+        return [watcher for _, watcher in self._entries[index:]]
@@ -0,0 +1,244 @@
+import re
+
+ATTRIBUTES = ('defense', 'Power', 'Vitality', 'Precision', 'Toughness',
+              'Critical Chance', 'Health', 'Concentration', 'Expertise',
+              'BoonDuration', 'ConditionDamage', 'Ferocity', 'CritDamage',
+              'Healing', 'ConditionDuration', 'AgonyResistance')
+ATTRIBUTE_INDEX = {attribute: i for i, attribute in enumerate(ATTRIBUTES)}
+PERCENTAGE_ATTRIBUTES = ('Critical Chance', 'CritDamage', 'ConditionDuration',
+                         'BoonDuration')
+ORDERED_ATTRIBUTES = ('Power', 'Toughness', 'Vitality', 'Precision',
+                      'Ferocity', 'ConditionDamage', 'Expertise',
+                      'Concentration', 'AgonyResistance', 'defense', 'Health',
+                      'Critical Chance', 'CritDamage', 'Healing',
+                      'ConditionDuration', 'BoonDuration')
+# Alternate weapons, aquatic gear and gathering tools don't count
+IGNORED_SLOTS = frozenset(('HelmAquatic', 'WeaponAquaticA', 'WeaponAquaticB',
+                           'WeaponB1', 'WeaponB2', "Sickle", "Axe", "Pick"))
+# Old attribute names and what they were renamed to
+RENAMED_ATTRIBUTES = {
+    "BoonDuration": "Concentration",
+    "CritDamage": "Ferocity",
+    "ConditionDuration": "Expertise"
+}
+ALL_STATS = ("Power", "Vitality", "Toughness", "Precision", "Ferocity",
+             "Healing", "ConditionDamage")
+MAX_LEVEL = 80
+# Primary attribute increase per level, for level ranges
+LEVEL_INCREASES = {
+    7: [2, 10],
+    10: [11, 20],
+    14: [21, 24],
+    15: [25, 26],
+    16: [27, 30],
+    20: [31, 40],
+    24: [41, 44],
+    25: [45, 46],
+    26: [47, 50],
+    30: [51, 60],
+    34: [61, 64],
+    35: [65, 66],
+    36: [67, 70],
+    44: [71, 74],
+    45: [75, 76],
+    46: [77, 80]
+}
+HEALTH_GROUP_1 = {
+    28: [1, 19],
+    70: [20, 39],
+    140: [40, 59],
+    210: [60, 79],
+    280: [80, 80]
+}
+HEALTH_GROUP_2 = {
+    18: [1, 19],
+    45: [20, 39],
+    90: [40, 59],
+    135: [60, 79],
+    180: [80, 80]
+}
+HEALTH_GROUP_3 = {
+    5: [1, 19],
+    12.5: [20, 39],
+    25: [40, 59],
+    37.5: [60, 79],
+    50: [80, 80]
+}
+PROFESSION_HEALTH_GROUPS = {
+    "warrior": HEALTH_GROUP_1,
+    "necromancer": HEALTH_GROUP_1,
+    "revenant": HEALTH_GROUP_2,
+    "engineer": HEALTH_GROUP_2,
+    "ranger": HEALTH_GROUP_2,
+    "mesmer": HEALTH_GROUP_2,
+    "guardian": HEALTH_GROUP_3,
+    "thief": HEALTH_GROUP_3,
+    "elementalist": HEALTH_GROUP_3
+}
+
+PATTERN_SINGLE = re.compile(r"^\+\d{1,} ")
+PATTERN_ALL_STATS = re.compile(r".* [s,S]tats$")
+PATTERN_PERCENTAGE = re.compile(r"^\+\d{1,}% ")
+
+
+def _increase_for_level(level, increases):
+    for increase, (low, high) in increases.items():
+        if low <= level <= high:
+            return increase
+
+
+def _build_base_attribute_table():
+    # Every level up to 10 increases the primary attributes, after that
+    # only even levels do
+    table = [0] * (MAX_LEVEL + 1)
+    total = 37
+    table[1] = total
+    for level in range(2, MAX_LEVEL + 1):
+        if level < 11 or level % 2 == 0:
+            total += _increase_for_level(level, LEVEL_INCREASES)
+        table[level] = total
+    return table
+
+
+def _build_health_table(increases):
+    table = [0] * (MAX_LEVEL + 1)
+    total = 0
+    for level in range(1, MAX_LEVEL + 1):
+        total += _increase_for_level(level, increases)
+        # Some professions gain fractional health per level
+        table[level] = int(total)
+    return table
+
+
+BASE_ATTRIBUTES = _build_base_attribute_table()
+BASE_HEALTH = {
+    profession: _build_health_table(group)
+    for profession, group in PROFESSION_HEALTH_GROUPS.items()
+}
+
+
+def empty_vector():
+    return [0] * len(ATTRIBUTES)
+
+
+def add_modifier(vector, attribute, modifier):
+    index = ATTRIBUTE_INDEX.get(attribute)
+    if index is not None:
+        vector[index] += modifier
+
+
+def add_vector(vector, other):
+    for i, value in enumerate(other):
+        if value:
+            vector[i] += value
+
+
+def infix_vector(item, *, rename=False):
+    """Attributes of an item's infix upgrade. Old attribute names are only
+    renamed if requested"""
+    vector = empty_vector()
+    infix = item["details"].get("infix_upgrade")
+    if infix:
+        for attribute in infix["attributes"]:
+            name = attribute["attribute"]
+            if rename:
+                name = RENAMED_ATTRIBUTES.get(name, name)
+            add_modifier(vector, name, attribute["modifier"])
+    return vector
+
+
+def rename_attributes(vector):
+    for old, new in RENAMED_ATTRIBUTES.items():
+        vector[ATTRIBUTE_INDEX[new]] += vector[ATTRIBUTE_INDEX[old]]
+        vector[ATTRIBUTE_INDEX[old]] = 0
+
+
+def upgrade_vector(item_upgrade):
+    """Attributes of an upgrade component, including percentage bonuses of
+    sigils. Rune set bonuses are handled by rune_vectors"""
+    vector = infix_vector(item_upgrade)
+    if item_upgrade["details"]["type"] == "Sigil":
+        bonus = item_upgrade["details"]["infix_upgrade"]["buff"]["description"]
+        if PATTERN_PERCENTAGE.match(bonus):
+            modifier = re.sub(' .*$', '', bonus)
+            modifier = re.sub(r'\+', '', modifier)
+            modifier = re.sub('%', '', modifier)
+            attribute_name = bonus.title()
+            attribute_name = re.sub(' Duration', 'Duration', attribute_name)
+            attribute_name = re.sub('Duration.*', 'Duration', attribute_name)
+            attribute_name = re.sub(' Chance', 'Chance', attribute_name)
+            attribute_name = re.sub('Chance.*', 'Chance', attribute_name)
+            attribute_name = re.sub('^.* ', '', attribute_name)
+            attribute_name = re.sub(r'\.', '', attribute_name)
+            add_modifier(vector, attribute_name, int(modifier))
+    return vector
+
+
+def rune_vectors(rune_item):
+    """Cumulative rune bonuses, indexed by the number of runes equipped
+    minus one"""
+    vectors = []
+    vector = empty_vector()
+    for bonus in rune_item["details"]["bonuses"]:
+        vector = list(vector)
+        if PATTERN_ALL_STATS.match(bonus):
+            modifier = re.sub(' .*$', '', bonus)
+            modifier = int(re.sub(r'\+', '', modifier))
+            for attribute in ALL_STATS:
+                add_modifier(vector, attribute, modifier)
+        elif PATTERN_SINGLE.match(bonus):
+            modifier = re.sub(' .*$', '', bonus)
+            modifier = re.sub(r'\+', '', modifier)
+            attribute_name = re.sub(' Damage', 'Damage', bonus)
+            attribute_name = re.sub('Damage.*', 'Damage', attribute_name)
+            attribute_name = re.sub(r'\+\d{1,} ', '', attribute_name)
+            attribute_name = re.sub(';.*', '', attribute_name)
+            add_modifier(vector, attribute_name, int(modifier))
+        elif PATTERN_PERCENTAGE.match(bonus):
+            modifier = re.sub(' .*$', '', bonus)
+            modifier = re.sub(r'\+', '', modifier)
+            modifier = re.sub('%', '', modifier)
+            attribute_name = re.sub(' Duration', 'Duration', bonus)
+            attribute_name = re.sub('Duration.*', 'Duration', attribute_name)
+            attribute_name = re.sub('^.* ', '', attribute_name)
+            add_modifier(vector, attribute_name, int(modifier))
+        vectors.append(vector)
+    return vectors
+
+
+def finalize_attributes(vector, level, profession):
+    """Add level based values and derived attributes to the summed gear
+    attributes. Returns {attribute: value} in display order"""
+    attr_dict = dict(zip(ATTRIBUTES, vector))
+    base_value = BASE_ATTRIBUTES[level]
+    attr_dict["Power"] += base_value
+    attr_dict["Vitality"] += base_value
+    attr_dict["Toughness"] += base_value
+    attr_dict["Precision"] += base_value
+    attr_dict["CritDamage"] += round(150 + attr_dict["Ferocity"] / 15, 2)
+    if attr_dict["CritDamage"] == 0:
+        attr_dict["CritDamage"] = int(attr_dict["CritDamage"])
+    attr_dict["BoonDuration"] += round(attr_dict["Concentration"] / 15, 2)
+    if attr_dict["BoonDuration"] == 0:
+        attr_dict["BoonDuration"] = int(attr_dict["BoonDuration"])
+    attr_dict["ConditionDuration"] += round(attr_dict["Expertise"] / 15, 2)
+    if attr_dict["ConditionDuration"] == 0:
+        attr_dict["ConditionDuration"] = int(attr_dict["ConditionDuration"])
+    # Base value of 1000 on lvl 80 doesn't get calculated,
+    # if below lvl 80 dont subtract it
+    if attr_dict["Precision"] < 1000:
+        base_prec = 0
+    else:
+        base_prec = 1000
+    attr_dict["Critical Chance"] = round(
+        4 + ((attr_dict["Precision"] - base_prec) / 21), 2)
+    attr_dict["defense"] += attr_dict["Toughness"]
+    attr_dict["Health"] = BASE_HEALTH[profession.lower()][level]
+    attr_dict["Health"] += attr_dict["Vitality"] * 10
+    output = {}
+    for attribute in ORDERED_ATTRIBUTES:
+        value = attr_dict[attribute]
+        if attribute in PERCENTAGE_ATTRIBUTES:
+            value = '{0}%'.format(round(value), 2)
+        output[attribute] = value
+    return output
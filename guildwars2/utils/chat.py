@@ -40,3 +40,19 @@ def embed_list_lines(embed,
 
 def cleanup_xml_tags(text):
     return re.sub("<[^<]+>", "", text)
+
+
+def chunk_embeds(embeds, max_embeds=10, total_max=6000):
+    chunk = []
+    total_count = 0
+    for embed in embeds:
+        length = len(embed)
+        if chunk and (len(chunk) == max_embeds
+                      or total_count + length > total_max):
+            yield chunk
+            chunk = []
+            total_count = 0
+        chunk.append(embed)
+        total_count += length
+    if chunk:
+        yield chunk
@@ -1,6 +1,86 @@
+import asyncio
+import logging
 import re
 
+from pymongo.errors import BulkWriteError, PyMongoError
+
+log = logging.getLogger(__name__)
+
 
 def prepare_search(search):
     sanitized = re.escape(search)
     return re.compile(sanitized + ".*", re.IGNORECASE)
+
+
+class WriteBehindBuffer:
+    """Collects write operations for a collection and sends them with a
+    single unordered bulk_write.
+
+    The buffer is flushed once it holds max_size operations, and otherwise
+    whenever flush is called. Each operation can be tagged with a key, the
+    keys of written operations are passed to on_flush. Operations are put
+    back when a flush fails without writing anything, up to max_pending
+    operations, after which the oldest ones are dropped.
+    """
+
+    def __init__(self, collection, max_size=500, on_flush=None,
+                 max_pending=None):
+        self.collection = collection
+        self.max_size = max_size
+        self.max_pending = max_pending or max_size * 10
+        self.on_flush = on_flush
+        self._operations = []
+        self._keys = set()
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._operations)
+
+    async def add(self, operation, key=None):
+        self._operations.append(operation)
+        if key is not None:
+            self._keys.add(key)
+        if len(self._operations) >= self.max_size:
+            try:
+                await self.flush()
+            except BulkWriteError:
+                # Already logged. The failed writes are dropped, retrying
+                # them would fail the same way
+                pass
+            except PyMongoError:
+                # Already logged, the next flush retries
+                pass
+
+    def _requeue(self, operations, keys):
+        operations = operations + self._operations
+        dropped = len(operations) - self.max_pending
+        if dropped > 0:
+            log.error("Dropping %d buffered writes to %s", dropped,
+                      self.collection.name)
+            operations = operations[dropped:]
+        self._operations = operations
+        self._keys |= keys
+
+    async def flush(self):
+        async with self._lock:
+            if not self._operations:
+                return
+            operations, keys = self._operations, self._keys
+            self._operations, self._keys = [], set()
+            try:
+                await self.collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                # The rest of the operations were written, and retrying the
+                # failed ones would fail the same way
+                errors = e.details.get("writeErrors", [])
+                log.error("%d buffered writes to %s failed: %s", len(errors),
+                          self.collection.name, errors[:5])
+                raise
+            except PyMongoError:
+                log.exception("Flushing %d buffered writes to %s failed",
+                              len(operations), self.collection.name)
+                self._requeue(operations, keys)
+                raise
+            finally:
+                if self.on_flush:
+                    self.on_flush(keys)
@@ -0,0 +1,202 @@
+import collections
+import datetime
+import struct
+import zlib
+
+EvtcHeader = collections.namedtuple(
+    "EvtcHeader", ["build", "revision", "boss_id", "players", "start_date"])
+
+ZIP_SIGNATURE = b"PK\x03\x04"
+ZIP_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+EVTC_HEADER = struct.Struct("<4s8sBHx")
+AGENT = struct.Struct("<QII6h64s4x")
+SKILL_SIZE = 68
+EVENT_SIZE = 64
+STATECHANGE_OFFSETS = {0: 59, 1: 56}
+STATECHANGE_LOG_START = 9
+NOT_A_PLAYER = 0xFFFFFFFF
+# LogStart is one of the very first events, don't read the whole log for it
+MAX_EVENTS_SCANNED = 256
+SOUGHT_BUFFS = ["Might", "Fury", "Quickness", "Alacrity", "Protection"]
+
+
+class EvtcParseError(Exception):
+    pass
+
+
+class EvtcHeaderParser:
+    """Incrementally parse the header of an .evtc, .zevtc or .zip log.
+
+    Feed it the raw bytes of the attachment as they arrive; once `done` is
+    set `header` holds the arcdps build, boss id, sorted player accounts and
+    the server start time. Everything past the first few events is ignored,
+    so only the beginning of the file ever needs to be downloaded.
+    """
+
+    def __init__(self):
+        self.header = None
+        self.done = False
+        self._raw = bytearray()
+        self._data = bytearray()
+        self._zipped = None
+        self._decompressor = None
+        self._header = None
+        self._events_offset = None
+
+    def feed(self, chunk):
+        """Feed the next chunk of the file. Returns True once the header
+        is parsed"""
+        if self.done:
+            return True
+        self._raw += chunk
+        if self._zipped is None:
+            if len(self._raw) < 4:
+                return False
+            self._zipped = self._raw[:4] == ZIP_SIGNATURE
+        if self._zipped:
+            self._inflate()
+        else:
+            self._data += self._raw
+            self._raw.clear()
+        self._parse()
+        return self.done
+
+    def _inflate(self):
+        if not self._decompressor:
+            if len(self._raw) < ZIP_LOCAL_HEADER.size:
+                return
+            (_, _, _, method, _, _, _, _, _, name_length,
+             extra_length) = ZIP_LOCAL_HEADER.unpack_from(self._raw)
+            offset = ZIP_LOCAL_HEADER.size + name_length + extra_length
+            if len(self._raw) < offset:
+                return
+            if method == 8:
+                self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            elif method == 0:
+                self._decompressor = _Stored()
+            else:
+                raise EvtcParseError(f"Unsupported compression {method}")
+            del self._raw[:offset]
+        try:
+            self._data += self._decompressor.decompress(bytes(self._raw))
+        except zlib.error as e:
+            raise EvtcParseError("Corrupted archive") from e
+        self._raw.clear()
+
+    def _parse(self):
+        data = self._data
+        if self._events_offset is None:
+            if len(data) < EVTC_HEADER.size + 4:
+                return
+            magic, build, revision, boss_id = EVTC_HEADER.unpack_from(data)
+            if magic != b"EVTC":
+                raise EvtcParseError("Not an EVTC log")
+            if revision not in STATECHANGE_OFFSETS:
+                raise EvtcParseError(f"Unsupported revision {revision}")
+            agent_count, = struct.unpack_from("<I", data, EVTC_HEADER.size)
+            skills_offset = EVTC_HEADER.size + 4 + agent_count * AGENT.size
+            if len(data) < skills_offset + 4:
+                return
+            skill_count, = struct.unpack_from("<I", data, skills_offset)
+            self._events_offset = skills_offset + 4 + skill_count * SKILL_SIZE
+            self._header = [
+                build.decode("ascii", "replace"), revision, boss_id,
+                self._parse_players(data, agent_count)
+            ]
+        revision = self._header[1]
+        statechange_offset = STATECHANGE_OFFSETS[revision]
+        start_date = None
+        for i in range(MAX_EVENTS_SCANNED):
+            offset = self._events_offset + i * EVENT_SIZE
+            if len(data) < offset + EVENT_SIZE:
+                return
+            if data[offset + statechange_offset] == STATECHANGE_LOG_START:
+                server_time, = struct.unpack_from("<I", data, offset + 24)
+                start_date = datetime.datetime.fromtimestamp(
+                    server_time, datetime.timezone.utc)
+                break
+        self.header = EvtcHeader(*self._header, start_date)
+        self.done = True
+        self._data = bytearray()
+
+    def _parse_players(self, data, agent_count):
+        players = []
+        offset = EVTC_HEADER.size + 4
+        for _ in range(agent_count):
+            _, _, is_elite, *_, name = AGENT.unpack_from(data, offset)
+            offset += AGENT.size
+            if is_elite == NOT_A_PLAYER:
+                continue
+            parts = name.split(b"\0")
+            if len(parts) < 2:
+                continue
+            account = parts[1].decode("utf-8", "replace").lstrip(":")
+            if account:
+                players.append(account)
+        return sorted(players)
+
+
+def summarize_encounter(data):
+    """Strip a dps.report JSON down to the fields the encounter embeds use.
+
+    The result keeps the shape of the original, so it can be used in its
+    place; it's just a few KB instead of megabytes.
+    """
+    targets = data["phases"][0]["targets"]
+    buff_map = {
+        key: {
+            "name": value["name"],
+            "stacking": value["stacking"]
+        }
+        for key, value in data["buffMap"].items()
+        if value["name"] in SOUGHT_BUFFS
+    }
+    buff_ids = {int(key[1:]) for key in buff_map}
+    players = []
+    for player in data["players"]:
+        summary = {
+            key: player[key]
+            for key in ("name", "account", "profession", "group", "guildID")
+            if key in player
+        }
+        summary["defenses"] = [{
+            "downCount": player["defenses"][0]["downCount"]
+        }]
+        summary["dpsTargets"] = [
+            [{
+                "dps": phases[0]["dps"]
+            }] if i in targets else []
+            for i, phases in enumerate(player["dpsTargets"])
+        ]
+        if "buffUptimes" in player:
+            summary["buffUptimes"] = [{
+                "id": uptime["id"],
+                "buffData": [{
+                    "uptime": uptime["buffData"][0]["uptime"]
+                }]
+            } for uptime in player["buffUptimes"] if uptime["id"] in buff_ids]
+        players.append(summary)
+    return {
+        "triggerID": data["triggerID"],
+        "fightName": data["fightName"],
+        "success": data["success"],
+        "duration": data["duration"],
+        "timeStart": data["timeStart"],
+        "timeEnd": data["timeEnd"],
+        "recordedBy": data.get("recordedBy"),
+        "phases": [{
+            "targets": targets
+        }],
+        "targets": [{
+            "name": target["name"],
+            "healthPercentBurned": target["healthPercentBurned"]
+        } for target in data["targets"]],
+        "buffMap": buff_map,
+        "players": players
+    }
+
+
+class _Stored:
+
+    def decompress(self, data):
+        return data
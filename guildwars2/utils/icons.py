@@ -0,0 +1,73 @@
+import asyncio
+import hashlib
+import io
+import os
+import threading
+
+from PIL import Image
+
+from .cache import LRUCache
+
+
+class IconCache:
+    """Cache for the icons used when rendering images.
+
+    Raw icon bytes are stored on disk, named after the hash of their URL,
+    and decoded, processed images are kept in a bounded LRU. Icons have to
+    be prefetched before rendering, after which `get` never touches the
+    network, so it is safe to call from an executor.
+    """
+
+    def __init__(self, session, directory, maxsize=512):
+        self.session = session
+        self.directory = directory
+        self._images = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, url):
+        name = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def _write(path, data):
+        # Write to a temporary file first so a concurrent render never sees
+        # a partially written icon
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    async def fetch(self, url):
+        path = self.path(url)
+        # Disk access is kept off the event loop
+        if await asyncio.to_thread(os.path.exists, path):
+            return
+        async with self.session.get(url) as r:
+            r.raise_for_status()
+            data = await r.read()
+        await asyncio.to_thread(self._write, path, data)
+
+    async def prefetch(self, urls):
+        await asyncio.gather(*(self.fetch(url) for url in set(urls)))
+
+    def get(self, url, key=None, transform=None):
+        """Return a copy of the decoded icon, processed by transform. Images
+        are cached per url and key, so each distinct transform should have
+        its own key"""
+        cache_key = url, key
+        with self._lock:
+            image = self._images.get(cache_key)
+        if image is None:
+            with open(self.path(url), "rb") as f:
+                image = Image.open(io.BytesIO(f.read()))
+                image.load()
+            if transform:
+                image = transform(image)
+            with self._lock:
+                self._images.set(cache_key, image)
+        return image.copy()
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
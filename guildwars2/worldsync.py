@@ -99,7 +99,7 @@ class WorldsyncMixin:
         on_world = False
         on_linked = False
         try:
-            doc = await self.bot.database.get(member, self)
+            doc = await self.get_user_doc(member)
             keys = doc.get("keys", [])
             key = doc.get("key", {})
             if (key and not keys) or key not in keys:
@@ -1,62 +1,20 @@
-import discord
+import datetime
 import io
+
+import discord
 from discord import app_commands
 from discord.app_commands import Choice
+from pymongo import UpdateOne
 
 from cogs.guildwars2.utils.db import prepare_search
-try:
-    import matplotlib
-    matplotlib.use("agg")
-    import matplotlib.pyplot as plt
-    import matplotlib.patheffects as pe
-    import matplotlib.dates as mdates
-    MATPLOTLIB_AVAILABLE = True
-except ImportError:
-    MATPLOTLIB_AVAILABLE = False
-import datetime
 
+from .rendering import (MATPLOTLIB_AVAILABLE, downsample_steps,
+                        render_population_graph, render_population_graph_hq)
 
-def generate_population_graph(data):
-    fig = plt.figure()
-    path_effects = [pe.withStroke(linewidth=1, foreground="black")]
-    ax = fig.add_subplot(111)
-    ax.set_yticks([0, 1, 2, 3, 4])
-    ax.set_yticklabels(["Low", "Medium", "High", "Very High", "Full"])
-    ax.set_title("Population over time",
-                 color="#ffa600",
-                 path_effects=path_effects)
-    ax.tick_params(axis="y", which="major", length=2)
-    ax.step(*zip(*data), where="post", color="#c12d2b")
-    ax.tick_params(axis="x", which="major", pad=0)
-    ax.tick_params(axis="both", labelcolor="#ffa600", color="#c12d2b")
-    ax.grid(b=True,
-            which="both",
-            color="black",
-            linestyle="-",
-            alpha=0.2,
-            path_effects=[
-                pe.withStroke(linewidth=1, foreground="white", alpha=0.2)
-            ])
-    ax.set_aspect(0.2 / ax.get_data_ratio())
-    plt.setp([ax.get_xticklines(), ax.get_yticklines()], color="#ffa600")
-    for spine in ax.spines.values():
-        spine.set_edgecolor("#e7691e")
-        spine.set_path_effects(path_effects)
-    locator = mdates.AutoDateLocator(maxticks=10)
-    formatter = mdates.ConciseDateFormatter(locator)
-    ax.xaxis.set_major_locator(locator)
-    ax.xaxis.set_major_formatter(formatter)
-    for tick in ax.xaxis.get_major_ticks() + ax.yaxis.get_major_ticks():
-        tick.label.set_path_effects(path_effects)
-    buf = io.BytesIO()
-    fig.savefig(buf,
-                format="png",
-                transparent=True,
-                bbox_inches="tight",
-                dpi=300)
-    plt.close(fig)
-    buf.seek(0)
-    return buf
+# Points plotted on population graphs at most
+POPULATION_GRAPH_RESOLUTION = 1000
+# Time span shown on population graphs
+POPULATION_GRAPH_DAYS = 365
 
 
 class WvwMixin:
@@ -134,11 +92,9 @@ class WvwMixin:
         if linked_worlds:
             data.add_field(name="Linked with", value=", ".join(linked_worlds))
         data.set_author(name=worldinfo["name"])
-        if MATPLOTLIB_AVAILABLE:
-            graph = await self.get_population_graph(worldinfo)
-            data.set_image(url=f"attachment://{graph.filename}")
-            return await interaction.followup.send(embed=data, file=graph)
-        await interaction.followup.send(embed=data)
+        graph = await self.get_population_graph(worldinfo)
+        data.set_image(url=f"attachment://{graph.filename}")
+        await interaction.followup.send(embed=data, file=graph)
 
     @wvw_group.command(name="population_track")
     @app_commands.describe(
@@ -153,7 +109,7 @@ class WvwMixin:
         wid = world
         if not wid:
             return await interaction.followup.send("Invalid world name")
-        doc = await self.bot.database.get_user(user, self)
+        doc = await self.get_user_doc(user)
         if doc and wid in doc.get("poptrack", []):
             return await interaction.followup.send(
                 "You're already tracking this world")
@@ -164,24 +120,158 @@ class WvwMixin:
         await interaction.followup.send(
             "You will be notiifed when {} is no longer full "
             "".format(world.title()))
-        await self.bot.database.set(user, {"poptrack": wid},
-                                    self,
-                                    operator="$push")
+        await self.set_user_doc(user, {"poptrack": wid}, operator="$push")
 
     def population_to_int(self, pop):
         pops = ["low", "medium", "high", "veryhigh", "full"]
         return pops.index(pop.lower().replace("_", ""))
 
-    async def get_population_graph(self, world):
-        cursor = self.db.worldpopulation.find({"world_id": world["id"]})
+    async def prepare_population_buckets(self):
+        await self.db.worldpopulation_buckets.create_index([("world_id", 1),
+                                                            ("month", 1)])
+        doc = await self.bot.database.get_cog_config(self)
+        if doc:
+            self.population_buckets_ready = doc.get(
+                "population_buckets_ready", False)
+            self.population_graph_hq = (doc.get("population_graph_hq", False)
+                                        and MATPLOTLIB_AVAILABLE)
+
+    @staticmethod
+    def population_bucket_update(world_id, date, population):
+        """Upsert a population sample into the world's bucket for the month
+        of date. Samples are stored once, however often they're added"""
+        month = datetime.datetime(date.year, date.month, 1)
+        return UpdateOne(
+            {"_id": "{}:{:%Y-%m}".format(world_id, month)}, {
+                "$setOnInsert": {
+                    "world_id": world_id,
+                    "month": month
+                },
+                "$addToSet": {
+                    "samples": {
+                        "date": date,
+                        "population": population
+                    }
+                }
+            },
+            upsert=True)
+
+    async def record_populations(self, date, populations):
+        """Store the changed populations of {world_id: population}. The
+        known populations are only updated once the samples are written,
+        so failed writes are picked up again on the next check"""
+        for world_id, population in populations.items():
+            await self.population_writes.add(
+                self.population_bucket_update(world_id, date, population))
+        await self.population_writes.flush()
+        for world_id, population in populations.items():
+            self.world_populations[world_id] = population
+            self.world_population_changes[world_id] = date
+
+    async def load_world_populations(self):
+        """Latest known population of every world, from the most recent
+        bucket of each world"""
+        populations = {}
+        changes = {}
+        cursor = self.db.worldpopulation_buckets.aggregate([{
+            "$sort": {
+                "world_id": 1,
+                "month": -1
+            }
+        }, {
+            "$group": {
+                "_id": "$world_id",
+                "samples": {
+                    "$first": "$samples"
+                }
+            }
+        }])
+        async for doc in cursor:
+            latest = max(doc["samples"], key=lambda sample: sample["date"])
+            populations[doc["_id"]] = latest["population"]
+            changes[doc["_id"]] = latest["date"]
+        if not self.population_buckets_ready:
+            async for world in self.db.worlds.find({}, {"_id": 1}):
+                if world["_id"] in populations:
+                    continue
+                doc = await self.db.worldpopulation.find_one(
+                    {"world_id": world["_id"]}, sort=[("date", -1)])
+                if doc:
+                    populations[world["_id"]] = doc["population"]
+                    changes[world["_id"]] = doc["date"]
+        self.world_populations = populations
+        self.world_population_changes = changes
+
+    async def get_population_history(self, world_id, since=None):
+        """Population samples of a world as sorted (date, population) pairs.
+        If since is given, only buckets from then on are read and the series
+        starts with the population at that time. Reads the legacy collection
+        too until it has been migrated"""
         data = []
+        query = {"world_id": world_id}
+        if since:
+            month = datetime.datetime(since.year, since.month, 1)
+            query["month"] = {"$gte": month}
+            # The population at the start of the range comes from the
+            # last bucket before it
+            previous = await self.db.worldpopulation_buckets.find_one(
+                {
+                    "world_id": world_id,
+                    "month": {
+                        "$lt": month
+                    }
+                }, {"samples": 1},
+                sort=[("month", -1)])
+            if previous:
+                for sample in previous["samples"]:
+                    data.append((sample["date"], sample["population"]))
+        cursor = self.db.worldpopulation_buckets.find(query, {"samples": 1})
         async for doc in cursor:
-            data.append((doc["date"], doc["population"]))
-        data.append((datetime.datetime.utcnow(),
-                     self.population_to_int(world["population"])))
+            for sample in doc["samples"]:
+                data.append((sample["date"], sample["population"]))
+        if not self.population_buckets_ready:
+            query = {"world_id": world_id}
+            if since:
+                query["date"] = {"$gte": since}
+                doc = await self.db.worldpopulation.find_one(
+                    {
+                        "world_id": world_id,
+                        "date": {
+                            "$lt": since
+                        }
+                    },
+                    sort=[("date", -1)])
+                if doc:
+                    data.append((doc["date"], doc["population"]))
+            cursor = self.db.worldpopulation.find(query)
+            async for doc in cursor:
+                data.append((doc["date"], doc["population"]))
         data.sort(key=lambda x: x[0])
-        graph = await self.bot.loop.run_in_executor(None,
-                                                    generate_population_graph,
-                                                    data)
-        file = discord.File(graph, "graph.png")
+        if since:
+            earlier = [point for point in data if point[0] < since]
+            data = [point for point in data if point[0] >= since]
+            if earlier:
+                data.insert(0, (since, earlier[-1][1]))
+        return data
+
+    async def get_population_graph(self, world):
+        population = self.population_to_int(world["population"])
+        # Graphs only change along with the population, apart from the
+        # last step growing, which the cache TTL takes care of
+        key = (world["id"], population,
+               self.world_population_changes.get(world["id"]))
+        graph = self.population_graph_cache.get(key)
+        if not graph:
+            now = datetime.datetime.utcnow()
+            since = now - datetime.timedelta(days=POPULATION_GRAPH_DAYS)
+            data = await self.get_population_history(world["id"], since)
+            data.append((now, population))
+            data = downsample_steps(data, POPULATION_GRAPH_RESOLUTION)
+            if self.population_graph_hq:
+                render = render_population_graph_hq
+            else:
+                render = render_population_graph
+            graph = await self.renderer.run(render, data)
+            self.population_graph_cache.set(key, graph)
+        file = discord.File(io.BytesIO(graph), "graph.png")
         return file